@@ -0,0 +1,186 @@
+"""Benchmarks for pid.
+
+Prints the results as JSON so they can be compared across releases::
+
+  python benchmarks/bench_pid.py --output results.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import multiprocessing
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+import pid  # NOQA
+from pid.decorator import pidfile  # NOQA
+
+timer = getattr(time, "perf_counter", time.time)
+
+
+def percentiles(samples, points=(50, 90, 99)):
+    samples = sorted(samples)
+    result = {
+        "min": samples[0],
+        "max": samples[-1],
+        "mean": sum(samples) / len(samples),
+    }
+    for point in points:
+        index = min(len(samples) - 1, int(round(point / 100.0 * (len(samples) - 1))))
+        result["p%d" % point] = samples[index]
+    return result
+
+
+def timed(func, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = timer()
+        func()
+        samples.append(timer() - start)
+    return samples
+
+
+def bench_create_close(piddir, iterations):
+    def cycle():
+        p = pid.PidFile("bench_create_close", piddir=piddir, register_atexit=False)
+        p.create()
+        p.close()
+
+    start = timer()
+    samples = timed(cycle, iterations)
+    elapsed = timer() - start
+    return {
+        "iterations": iterations,
+        "per_second": iterations / elapsed,
+        "latency": percentiles(samples),
+    }
+
+
+def bench_check(piddir, iterations):
+    def check(p):
+        try:
+            p.check()
+        except pid.PidFileAlreadyRunningError:
+            pass
+
+    result = {}
+    with pid.PidFile("bench_check_held", piddir=piddir, register_atexit=False):
+        p = pid.PidFile("bench_check_held", piddir=piddir, register_atexit=False)
+        result["held"] = percentiles(timed(lambda: check(p), iterations))
+
+    p = pid.PidFile("bench_check_nofile", piddir=piddir, register_atexit=False)
+    result["nofile"] = percentiles(timed(lambda: check(p), iterations))
+
+    p = pid.PidFile("bench_check_stale", piddir=piddir, register_atexit=False)
+    p.setup()
+    with open(p.filename, "w") as fh:
+        # hope this does not clash
+        fh.write("999999999\n")
+    result["stale"] = percentiles(timed(lambda: check(p), iterations))
+    return result
+
+
+def bench_decorator(piddir, iterations):
+    def func():
+        pass
+
+    decorated = pidfile("bench_decorator", piddir=piddir, register_atexit=False)(func)
+    reused = pidfile("bench_decorator", piddir=piddir, register_atexit=False, reuse=True)(func)
+    held = pidfile("bench_decorator", piddir=piddir, register_atexit=False, hold=True)(func)
+    bare = percentiles(timed(func, iterations))
+    wrapped = percentiles(timed(decorated, iterations))
+    wrapped_reuse = percentiles(timed(reused, iterations))
+    wrapped_hold = percentiles(timed(held, iterations))
+    held.pidfile.close()
+    return {
+        "bare": bare,
+        "decorated": wrapped,
+        "decorated_reuse": wrapped_reuse,
+        "decorated_hold": wrapped_hold,
+        "overhead_p50": wrapped["p50"] - bare["p50"],
+        "overhead_reuse_p50": wrapped_reuse["p50"] - bare["p50"],
+        "overhead_hold_p50": wrapped_hold["p50"] - bare["p50"],
+    }
+
+
+def _contention_worker(piddir, iterations, hold, start_event, queue):
+    samples = []
+    start_event.wait()
+    for _ in range(iterations):
+        p = pid.PidFile("bench_contention", piddir=piddir, register_atexit=False, register_term_signal_handler=False)
+        start = timer()
+        p.create(blocking=True, timeout=60)
+        samples.append(timer() - start)
+        time.sleep(hold)
+        p.close()
+    queue.put(samples)
+
+
+def bench_contention(piddir, processes, iterations, hold):
+    start_event = multiprocessing.Event()
+    queue = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(target=_contention_worker, args=(piddir, iterations, hold, start_event, queue))
+        for _ in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+
+    start = timer()
+    start_event.set()
+    samples = []
+    for _ in workers:
+        samples.extend(queue.get())
+    elapsed = timer() - start
+    for worker in workers:
+        worker.join()
+
+    return {
+        "processes": processes,
+        "iterations": iterations,
+        "hold": hold,
+        "acquisitions_per_second": len(samples) / elapsed,
+        "acquisition_latency": percentiles(samples),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000, help="iterations for the single process benchmarks")
+    parser.add_argument("--processes", type=int, default=4, help="number of processes racing in the contention benchmark")
+    parser.add_argument("--contention-iterations", type=int, default=50, help="acquisitions per process in the contention benchmark")
+    parser.add_argument("--hold", type=float, default=0.001, help="seconds the lock is held in the contention benchmark")
+    parser.add_argument("--output", help="write results to this file instead of stdout")
+    args = parser.parse_args(argv)
+
+    piddir = tempfile.mkdtemp(prefix="pid-bench-")
+    try:
+        results = {
+            "pid_version": pid.__version__,
+            "python": platform.python_implementation() + " " + platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.time(),
+            "benchmarks": {
+                "create_close": bench_create_close(piddir, args.iterations),
+                "check": bench_check(piddir, args.iterations),
+                "decorator": bench_decorator(piddir, args.iterations),
+                "contention": bench_contention(piddir, args.processes, args.contention_iterations, args.hold),
+            },
+        }
+    finally:
+        shutil.rmtree(piddir)
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as fh:
+            fh.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
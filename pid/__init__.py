@@ -1,10 +1,12 @@
 import sys
 from .base import (
-    DEFAULT_PID_DIR,
     PID_CHECK_EMPTY,
     PID_CHECK_NOFILE,
     PID_CHECK_SAMEPID,
     PID_CHECK_NOTRUNNING,
+    PID_CHECK_RUNNING,
+    PID_CHECK_UNREADABLE,
+    PID_CHECK_LEASE_EXPIRED,
     PidFileError,
     PidFileConfigurationError,
     PidFileUnreadableError,
@@ -16,8 +18,21 @@ if sys.platform == "win32":
     from .win32 import PidFile  # NOQA
 else:
     from .posix import PidFile  # NOQA
+from .scanner import scan  # NOQA
+
+if sys.version_info < (3, 7):
+    from .base import DEFAULT_PID_DIR  # NOQA
 
 __version__ = "3.0.4"
+
+
+def __getattr__(name):
+    if name == "DEFAULT_PID_DIR":
+        from . import base
+        return base.DEFAULT_PID_DIR
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
 __all__ = [
     '__version__',
     'DEFAULT_PID_DIR',
@@ -25,10 +40,14 @@ __all__ = [
     'PID_CHECK_NOFILE',
     'PID_CHECK_SAMEPID',
     'PID_CHECK_NOTRUNNING',
+    'PID_CHECK_RUNNING',
+    'PID_CHECK_UNREADABLE',
+    'PID_CHECK_LEASE_EXPIRED',
     'PidFile',
     'PidFileError',
     'PidFileConfigurationError',
     'PidFileUnreadableError',
     'PidFileAlreadyRunningError',
     'PidFileAlreadyLockedError',
+    'scan',
 ]
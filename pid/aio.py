@@ -0,0 +1,297 @@
+import errno
+import signal
+import asyncio
+import functools
+from . import PidFile
+from .base import (
+    WAIT_POLL_INTERVAL,
+    PidFileAlreadyLockedError,
+    PidFileConfigurationError,
+)
+from .utils import (
+    LockWaiter,
+    monotonic,
+)
+from .watch import Watcher
+
+_get_running_loop = getattr(asyncio, "get_running_loop", asyncio.get_event_loop)
+_current_task = getattr(asyncio, "current_task", None) or asyncio.Task.current_task
+
+
+def _close_result(future):
+    if not future.cancelled() and future.exception() is None and future.result() is not None:
+        future.result().close()
+
+
+class AsyncPidFile(PidFile):
+    """PidFile for asyncio applications.
+
+    File system work runs in the default executor and waiting for the lock
+    never blocks the event loop. The SIGTERM handler is installed with
+    loop.add_signal_handler() when the pidfile is acquired, on SIGTERM it
+    releases the pidfile and then cancels the task which acquired it.
+    """
+
+    __slots__ = ("_signal_loop", "_signal_previous", "_owner_task")
+
+    def __init__(self, *args, **kwargs):
+        super(AsyncPidFile, self).__init__(*args, **kwargs)
+        if self.process_registry or self.reentrant:
+            # holders within the process are arbitrated with blocking thread locks
+            raise PidFileConfigurationError("process_registry and reentrant are not supported by AsyncPidFile")
+        self._signal_loop = None
+        self._signal_previous = None
+        self._owner_task = None
+
+    def _register_term_signal(self):
+        # signal handlers are registered on the event loop by acquire()
+        pass
+
+    def _register_loop_term_signal(self, loop):
+        register_term_signal_handler = self.register_term_signal_handler
+        if register_term_signal_handler == "auto":
+            register_term_signal_handler = signal.getsignal(signal.SIGTERM) == signal.SIG_DFL
+
+        if callable(register_term_signal_handler):
+            handler = functools.partial(register_term_signal_handler, signal.SIGTERM, None)
+        elif register_term_signal_handler:
+            handler = self._handle_term_signal
+        else:
+            return
+
+        previous = signal.getsignal(signal.SIGTERM)
+        try:
+            loop.add_signal_handler(signal.SIGTERM, handler)
+        except (NotImplementedError, RuntimeError, ValueError):
+            # not supported on this platform or not running in the main thread
+            self.logger.debug("%r could not register SIGTERM handler on %r", self, loop)
+        else:
+            self._signal_loop = loop
+            self._signal_previous = previous
+            self._owner_task = _current_task()
+
+    def _restore_term_signal(self):
+        loop, self._signal_loop = self._signal_loop, None
+        previous, self._signal_previous = self._signal_previous, None
+        self._owner_task = None
+        if loop is None:
+            return
+        # resets the handler to SIG_DFL, put back the one replaced by acquire()
+        loop.remove_signal_handler(signal.SIGTERM)
+        if previous is not None:
+            signal.signal(signal.SIGTERM, previous)
+
+    def _handle_term_signal(self):
+        # shut down through cancellation instead of raising from a loop callback
+        self.logger.debug("%r received SIGTERM, releasing pidfile", self)
+        task = self._owner_task
+        release = self._signal_loop.create_task(self.release())
+        if task is not None:
+            release.add_done_callback(lambda _: task.cancel())
+
+    async def _run(self, func, *args):
+        return await _get_running_loop().run_in_executor(None, func, *args)
+
+    async def _wait_flock(self, timeout):
+        loop = _get_running_loop()
+        deadline = None if timeout is None else monotonic() + timeout
+        with LockWaiter(self._flock, self.fh.fileno(), self.filename, WAIT_POLL_INTERVAL) as waiter:
+            woken = False
+            while not waiter.try_lock():
+                interval = waiter.next_interval(woken)
+                if deadline is not None:
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        return False
+                    interval = min(interval, remaining)
+                if waiter.fileno() is None:
+                    await asyncio.sleep(interval)
+                else:
+                    woken = await self._wait_readable(loop, waiter, interval)
+            return True
+
+    @staticmethod
+    async def _wait_readable(loop, waiter, timeout):
+        future = loop.create_future()
+
+        def wakeup():
+            if not future.done():
+                future.set_result(None)
+
+        loop.add_reader(waiter.fileno(), wakeup)
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            loop.remove_reader(waiter.fileno())
+        return waiter.woken()
+
+    async def _lock_async(self, blocking, timeout):
+        start = monotonic()
+        try:
+            while True:
+                try:
+                    self._flock(self.fh.fileno())
+                except IOError:
+                    if not blocking:
+                        raise
+                    remaining = None if timeout is None else max(0, timeout - (monotonic() - start))
+                    if not await self._wait_flock(remaining):
+                        raise IOError(errno.EWOULDBLOCK, "Timed out after %.3f seconds waiting for lock" % (monotonic() - start))
+
+                if not self._is_unlinked(self.fh.fileno()):
+                    return
+                self.fh.close()
+                self.fh = await self._run_open(self._open)
+        finally:
+            self.lock_wait_time = monotonic() - start
+
+    async def _run_open(self, func, *args):
+        # a file opened in the executor after the caller was cancelled is closed
+        # instead of being left open, together with any lock taken on it
+        future = _get_running_loop().run_in_executor(None, func, *args)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            future.add_done_callback(_close_result)
+            raise
+
+    async def _lock_or_take_over_async(self, blocking, timeout):
+        start = monotonic()
+        try:
+            try:
+                return await self._lock_async(False, None)
+            except IOError as exc:
+                locked_error = exc
+
+            # takes over an expired lease, the takeover itself never waits long
+            fh = await self._run_open(self._take_over, self.fh)
+            if fh is not None:
+                self.fh.close()
+                self.fh = fh
+                return
+            if not blocking:
+                raise locked_error
+            remaining = None if timeout is None else max(0, timeout - (monotonic() - start))
+            await self._lock_async(blocking, remaining)
+        finally:
+            self.lock_wait_time = monotonic() - start
+
+    async def acquire(self, blocking=False, timeout=None):
+        await self._run(self.setup)
+
+        self.logger.debug("%r acquire pidfile: %s", self, self.filename)
+        if self._already_created():
+            return
+
+        self.fh = await self._run_open(self._open)
+        locked = False
+        try:
+            if self.lock_pidfile:
+                blocking = (blocking or timeout is not None) and not self.allow_samepid
+                collector = self._get_collector()
+                try:
+                    if self.lease:
+                        await self._lock_or_take_over_async(blocking, timeout)
+                    else:
+                        await self._lock_async(blocking, timeout)
+                except IOError as exc:
+                    if collector is not None:
+                        collector.event("flock", self.lock_wait_time, "locked", self)
+                    if not self.allow_samepid:
+                        raise PidFileAlreadyLockedError(exc)
+                else:
+                    locked = True
+                    if collector is not None:
+                        collector.event("flock", self.lock_wait_time, "ok", self)
+
+            await self._run(self._write_pidfile, locked and self.trust_lock)
+            if self._need_cleanup:
+                self._start_background()
+        except BaseException:
+            # includes cancellation while waiting for the lock
+            if not self._need_cleanup:
+                self.close(cleanup=False)
+            raise
+
+        if self._signal_loop is None:
+            self._register_loop_term_signal(_get_running_loop())
+
+    async def release(self):
+        self._restore_term_signal()
+        await self._run(self.close)
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type=None, exc_value=None, exc_tb=None):
+        await self.release()
+
+
+class AsyncWatcher(Watcher):
+    """Watcher for asyncio applications.
+
+    read() and wait_for() are coroutines and `async for` yields the events.
+    The inotify descriptor is watched with loop.add_reader(), when polling the
+    event loop sleeps between polls.
+    """
+
+    async def read(self, timeout=None):
+        if self._pending:
+            events, self._pending = self._pending, []
+            return events
+
+        deadline = None if timeout is None else monotonic() + timeout
+        while True:
+            events = self._diff() if self._fd is None else self._read_inotify()
+            if events:
+                return events
+            remaining = None if deadline is None else deadline - monotonic()
+            if remaining is not None and remaining <= 0:
+                return events
+            if self._fd is None:
+                await asyncio.sleep(self.poll_interval if remaining is None else min(self.poll_interval, remaining))
+            elif not await self._wait_readable(remaining):
+                return []
+
+    async def _wait_readable(self, timeout):
+        loop = _get_running_loop()
+        future = loop.create_future()
+
+        def wakeup():
+            if not future.done():
+                future.set_result(None)
+
+        loop.add_reader(self._fd, wakeup)
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            loop.remove_reader(self._fd)
+        return True
+
+    async def wait_for(self, kinds=("created", "written", "deleted"), timeout=None):
+        deadline = None if timeout is None else monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0, deadline - monotonic())
+            events = await self.read(remaining)
+            for index, event in enumerate(events):
+                if event.kind in kinds:
+                    self._pending = events[index + 1:] + self._pending
+                    return event
+            if deadline is not None and monotonic() >= deadline:
+                return None
+
+    def __iter__(self):
+        raise TypeError("use async for with an AsyncWatcher")
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._pending:
+            self._pending = await self.read()
+        return self._pending.pop(0)
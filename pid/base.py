@@ -1,13 +1,19 @@
 import os
 import sys
+import time
 import errno
-import atexit
-import signal
-import logging
-import tempfile
+from . import metrics
 from .utils import (
+    HEARTBEAT_FORMAT,
+    LockWaiter,
+    boot_id,
     determine_pid_directory,
     effective_access,
+    lease_expired,
+    monotonic,
+    parse_pidfile,
+    process_matches,
+    process_start_time,
 )
 try:
     from contextlib import ContextDecorator as BaseObject
@@ -15,12 +21,86 @@ except ImportError:
     BaseObject = object
 
 
-DEFAULT_PID_DIR = determine_pid_directory()
+if sys.version_info < (3, 7):
+    DEFAULT_PID_DIR = determine_pid_directory()
 DEFAULT_CHMOD = 0o644
+# interval used when waiting for a process to exit can only be done by polling
+WAIT_POLL_INTERVAL = 0.05
 PID_CHECK_EMPTY = "PID_CHECK_EMPTY"
 PID_CHECK_NOFILE = "PID_CHECK_NOFILE"
 PID_CHECK_SAMEPID = "PID_CHECK_SAMEPID"
 PID_CHECK_NOTRUNNING = "PID_CHECK_NOTRUNNING"
+PID_CHECK_RUNNING = "PID_CHECK_RUNNING"
+PID_CHECK_UNREADABLE = "PID_CHECK_UNREADABLE"
+PID_CHECK_LEASE_EXPIRED = "PID_CHECK_LEASE_EXPIRED"
+# pidfiles are ASCII, latin-1 also reads past the text into a status block without errors
+_OPEN_KWARGS = {"encoding": "latin-1"} if sys.version_info[0] >= 3 else {}
+
+
+def __getattr__(name):
+    # determine DEFAULT_PID_DIR on first use instead of at import time
+    if name == "DEFAULT_PID_DIR":
+        value = globals()["DEFAULT_PID_DIR"] = determine_pid_directory()
+        return value
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+def get_default_pid_dir():
+    try:
+        return DEFAULT_PID_DIR
+    except NameError:
+        return __getattr__("DEFAULT_PID_DIR")
+
+
+# directories which passed validate_piddir(), shared by all PidFile instances
+# so only the first PidFile set up in a directory pays for the checks
+_validated_piddirs = set()
+
+
+def validate_piddir(piddir):
+    if os.path.exists(piddir) and not os.path.isdir(piddir):
+        raise IOError("Pid file directory '%s' exists but is not a directory" % piddir)
+    if not os.path.isdir(piddir):
+        os.makedirs(piddir)
+    if not effective_access(piddir, os.R_OK):
+        raise IOError("Pid file directory '%s' cannot be read" % piddir)
+    if not effective_access(piddir, os.W_OK | os.X_OK):
+        raise IOError("Pid file directory '%s' cannot be written to" % piddir)
+    _validated_piddirs.add(piddir)
+
+
+# PidFiles which have been set up, the child of a fork resets them so it never
+# holds or removes the pidfiles of its parent
+_live_pidfiles = None
+
+
+def _track(pidfile):
+    global _live_pidfiles
+    if _live_pidfiles is None:
+        import weakref
+        _live_pidfiles = weakref.WeakSet()
+    _live_pidfiles.add(pidfile)
+
+
+def _after_fork_in_child():
+    if _live_pidfiles is None:
+        return
+    for pidfile in list(_live_pidfiles):
+        try:
+            pidfile._after_fork_in_child()
+        except Exception:
+            pidfile.logger.exception("%r failed to reset after fork", pidfile)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def invalidate_piddir_cache(piddir=None):
+    if piddir is None:
+        _validated_piddirs.clear()
+    else:
+        _validated_piddirs.discard(os.path.abspath(piddir))
 
 
 class PidFileError(Exception):
@@ -46,46 +126,87 @@ class PidFileAlreadyLockedError(PidFileError):
 
 
 class PidFileBase(BaseObject):
+    # remove the pidfile while still holding the lock, so a process waiting for
+    # the lock never ends up holding it on a file which is about to be removed
+    _remove_before_unlock = False
+
     __slots__ = (
         "pid", "pidname", "piddir", "enforce_dotpid_postfix",
         "register_term_signal_handler", "register_atexit", "filename",
-        "fh", "lock_pidfile", "chmod", "uid", "gid", "force_tmpdir",
-        "allow_samepid", "_logger", "_is_setup", "_need_cleanup",
+        "fh", "lock_pidfile", "lock_backend", "chmod", "uid", "gid", "force_tmpdir",
+        "allow_samepid", "record_start_time", "trust_lock", "collector", "lock_wait_time",
+        "process_registry", "prefork", "reentrant", "worker_pidfile", "lease", "heartbeat_interval",
+        "status_block", "forward_handler", "_forward_listener",
+        "_logger", "_is_setup", "_need_cleanup", "_registry_entry", "_depth", "_heartbeat",
     )
 
     def __init__(self, pidname=None, piddir=None, enforce_dotpid_postfix=True,
                  register_term_signal_handler="auto", register_atexit=True,
                  lock_pidfile=True, chmod=DEFAULT_CHMOD, uid=-1, gid=-1, force_tmpdir=False,
-                 allow_samepid=False):
+                 allow_samepid=False, record_start_time=False, trust_lock=None, collector=None,
+                 lock_backend="flock", process_registry=False, prefork=False, reentrant=False,
+                 lease=None, heartbeat_interval=None, status_block=False, forward_handler=None):
         self.pidname = pidname
         self.piddir = piddir
         self.enforce_dotpid_postfix = enforce_dotpid_postfix
         self.register_term_signal_handler = register_term_signal_handler
         self.register_atexit = register_atexit
         self.lock_pidfile = lock_pidfile
+        self.lock_backend = lock_backend
         self.chmod = chmod
         self.uid = uid
         self.gid = gid
         self.force_tmpdir = force_tmpdir
         self.allow_samepid = allow_samepid
+        self.record_start_time = record_start_time
+        # by default the lock alone decides, use trust_lock=False to also check
+        # the pid in a pidfile which could be locked
+        self.trust_lock = lock_pidfile if trust_lock is None else trust_lock
+        self.collector = collector
+        # nested acquisitions are tracked by the process registry
+        self.process_registry = process_registry or reentrant
+        self.prefork = prefork
+        self.reentrant = reentrant
+        self.lease = lease
+        self.heartbeat_interval = heartbeat_interval
+        self.forward_handler = forward_handler
+        self.status_block = status_block
+        if heartbeat_interval and not (lease or status_block):
+            raise PidFileConfigurationError("heartbeat_interval requires a lease or a status_block")
+        if heartbeat_interval and self.process_registry:
+            raise PidFileConfigurationError("heartbeat_interval cannot be combined with process_registry, call heartbeat() instead")
+        if forward_handler is not None and self.process_registry:
+            raise PidFileConfigurationError("forward_handler cannot be combined with process_registry")
 
         self.fh = None
         self.filename = None
         self.pid = None
+        self.lock_wait_time = None
+        self.worker_pidfile = None
 
         self._logger = None
         self._is_setup = False
         self._need_cleanup = False
+        self._registry_entry = None
+        self._depth = 0
+        self._heartbeat = None
+        self._forward_listener = None
 
     @property
     def logger(self):
         if not self._logger:
+            import logging
             self._logger = logging.getLogger("PidFile")
 
         return self._logger
 
+    def _get_collector(self):
+        return self.collector if self.collector is not None else metrics.default_collector
+
     def setup(self):
         if not self._is_setup:
+            collector = self._get_collector()
+            start = monotonic() if collector is not None else None
             self.logger.debug("%r entering setup", self)
             if self.filename is None:
                 self.pid = os.getpid()
@@ -93,10 +214,48 @@ class PidFileBase(BaseObject):
                 self._register_term_signal()
 
             if self.register_atexit:
+                import atexit
                 atexit.register(self.close)
+            _track(self)
 
             # setup should only be performed once
             self._is_setup = True
+            if collector is not None:
+                collector.event("setup", monotonic() - start, "ok", self)
+
+    def _after_fork_in_child(self):
+        held = self._need_cleanup
+        self.pid = os.getpid()
+        self.worker_pidfile = None
+        # the heartbeat and forwarding threads do not exist in the child
+        self._heartbeat = None
+        listener, self._forward_listener = self._forward_listener, None
+        if listener is not None:
+            listener.close_inherited()
+        if self.fh is not None:
+            # close the inherited handle without touching the pidfile of the parent
+            self._registry_entry = None
+            self._depth = 0
+            self._need_cleanup = False
+            self._close(None, False)
+            self.fh = None
+
+        if held and self.prefork:
+            self.worker_pidfile = self._make_worker_pidfile()
+            self.worker_pidfile.create()
+
+    def _make_worker_pidfile(self):
+        root, ext = os.path.splitext(os.path.basename(self.filename))
+        return self.__class__(
+            "%s-%d%s" % (root, self.pid, ext), piddir=os.path.dirname(self.filename),
+            enforce_dotpid_postfix=False, register_term_signal_handler=self.register_term_signal_handler,
+            register_atexit=self.register_atexit, lock_pidfile=self.lock_pidfile, chmod=self.chmod,
+            uid=self.uid, gid=self.gid, allow_samepid=self.allow_samepid,
+            record_start_time=self.record_start_time, trust_lock=self.trust_lock,
+            collector=self.collector, lock_backend=self.lock_backend,
+            lease=self.lease, heartbeat_interval=self.heartbeat_interval,
+            status_block=self.status_block,
+        )
 
     def _make_filename(self):
         pidname = self.pidname
@@ -106,24 +265,23 @@ class PidFileBase(BaseObject):
         if self.enforce_dotpid_postfix and not pidname.endswith(".pid"):
             pidname = "%s.pid" % pidname
         if piddir is None:
-            if os.path.isdir(DEFAULT_PID_DIR) and self.force_tmpdir is False:
-                piddir = DEFAULT_PID_DIR
+            default_pid_dir = os.path.abspath(get_default_pid_dir())
+            if self.force_tmpdir is False and (default_pid_dir in _validated_piddirs or os.path.isdir(default_pid_dir)):
+                piddir = default_pid_dir
             else:
+                import tempfile
                 piddir = tempfile.gettempdir()
 
-        if os.path.exists(piddir) and not os.path.isdir(piddir):
-            raise IOError("Pid file directory '%s' exists but is not a directory" % piddir)
-        if not os.path.isdir(piddir):
-            os.makedirs(piddir)
-        if not effective_access(piddir, os.R_OK):
-            raise IOError("Pid file directory '%s' cannot be read" % piddir)
-        if not effective_access(piddir, os.W_OK | os.X_OK):
-            raise IOError("Pid file directory '%s' cannot be written to" % piddir)
+        piddir = os.path.abspath(piddir)
+        if piddir not in _validated_piddirs:
+            validate_piddir(piddir)
 
         filename = os.path.abspath(os.path.join(piddir, pidname))
         return filename
 
     def _register_term_signal(self):
+        import signal
+
         register_term_signal_handler = self.register_term_signal_handler
         if register_term_signal_handler == "auto":
             if signal.getsignal(signal.SIGTERM) == signal.SIG_DFL:
@@ -140,13 +298,34 @@ class PidFileBase(BaseObject):
 
             signal.signal(signal.SIGTERM, sigterm_noop_handler)
 
+    def _open_file(self, readonly=False):
+        if (self.lease or self.status_block) and not readonly:
+            # the heartbeat is written in place, which is not possible in append mode
+            return os.fdopen(os.open(self.filename, os.O_RDWR | os.O_CREAT, 0o666), "r+", **_OPEN_KWARGS)
+        return open(self.filename, "r" if readonly else "a+", **_OPEN_KWARGS)
+
+    def _open(self):
+        try:
+            return self._open_file()
+        except IOError:
+            piddir = os.path.dirname(self.filename)
+            if piddir not in _validated_piddirs:
+                raise
+            # directory changed since it was validated, validate again
+            # which recreates it when it was removed
+            _validated_piddirs.discard(piddir)
+            validate_piddir(piddir)
+            return self._open_file()
+
+    def _read_pidfile(self, fh):
+        fh.seek(0)
+        return parse_pidfile(fh.read(256))
+
     def _inner_check(self, fh):
         try:
-            fh.seek(0)
-            pid_str = fh.read(16).split("\n", 1)[0].strip()
-            if not pid_str:
+            pid, metadata = self._read_pidfile(fh)
+            if pid is None:
                 return PID_CHECK_EMPTY
-            pid = int(pid_str)
         except (IOError, ValueError) as exc:
             self.close(fh=fh)
             raise PidFileUnreadableError(exc)
@@ -156,6 +335,12 @@ class PidFileBase(BaseObject):
 
         try:
             if self._pid_exists(pid):
+                if not process_matches(pid, metadata):
+                    # pid has been recycled by an unrelated process
+                    return PID_CHECK_NOTRUNNING
+                if lease_expired(metadata):
+                    # running but no longer updating its heartbeat, most likely hung
+                    return PID_CHECK_LEASE_EXPIRED
                 raise PidFileAlreadyRunningError("Program already running with pid: %d" % pid, pid=pid)
             else:
                 return PID_CHECK_NOTRUNNING
@@ -166,13 +351,60 @@ class PidFileBase(BaseObject):
     def _pid_exists(self, pid):
         raise NotImplementedError()
 
-    def _flock(self, fileno):
+    def _wait_pid(self, pid, metadata, timeout):
+        deadline = None if timeout is None else monotonic() + timeout
+        while True:
+            try:
+                # a recycled pid belongs to another process, the recorded one exited
+                if not self._pid_exists(pid) or not process_matches(pid, metadata):
+                    return True
+            except PidFileAlreadyRunningError:
+                # process exists but is not ours to signal
+                pass
+            if deadline is None:
+                time.sleep(WAIT_POLL_INTERVAL)
+                continue
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(WAIT_POLL_INTERVAL, remaining))
+
+    def _flock(self, fileno, blocking=False):
         raise NotImplementedError()
 
-    def _chmod(self):
+    def _is_unlinked(self, fileno):
+        return False
+
+    def _lock(self, blocking=False, timeout=None):
+        start = monotonic()
+        try:
+            while True:
+                try:
+                    self._flock(self.fh.fileno())
+                except IOError:
+                    if not blocking:
+                        raise
+                    if timeout is None:
+                        self._flock(self.fh.fileno(), blocking=True)
+                    else:
+                        remaining = max(0, timeout - (monotonic() - start))
+                        with LockWaiter(self._flock, self.fh.fileno(), self.filename, WAIT_POLL_INTERVAL) as waiter:
+                            locked = waiter.wait(remaining)
+                        if not locked:
+                            raise IOError(errno.EWOULDBLOCK, "Timed out after %.3f seconds waiting for lock" % (monotonic() - start))
+
+                # the previous holder removes the pidfile before releasing the lock
+                if not self._is_unlinked(self.fh.fileno()):
+                    return
+                self.fh.close()
+                self.fh = self._open()
+        finally:
+            self.lock_wait_time = monotonic() - start
+
+    def _chmod(self, fileno):
         raise NotImplementedError()
 
-    def _chown(self):
+    def _chown(self, fileno):
         raise NotImplementedError()
 
     def check(self):
@@ -180,60 +412,484 @@ class PidFileBase(BaseObject):
 
         self.logger.debug("%r check pidfile: %s", self, self.filename)
 
+        collector = self._get_collector()
+        if collector is None:
+            return self._check()
+
+        start = monotonic()
+        outcome = "error"
+        try:
+            outcome = self._check()
+            return outcome
+        except PidFileAlreadyRunningError:
+            outcome = PID_CHECK_RUNNING
+            raise
+        except PidFileUnreadableError:
+            outcome = PID_CHECK_UNREADABLE
+            raise
+        finally:
+            collector.event("check", monotonic() - start, outcome, self)
+
+    def _check(self):
         if self.fh is None:
-            if self.filename and os.path.isfile(self.filename):
-                with open(self.filename, "r") as fh:
-                    return self._inner_check(fh)
-            return PID_CHECK_NOFILE
+            if not self.filename:
+                return PID_CHECK_NOFILE
+            try:
+                fh = self._open_file(readonly=True)
+            except IOError as exc:
+                if exc.errno in (errno.ENOENT, errno.EISDIR):
+                    return PID_CHECK_NOFILE
+                raise
+            try:
+                return self._inner_check(fh)
+            finally:
+                fh.close()
 
         return self._inner_check(self.fh)
 
-    def create(self):
+    def wait_for_exit(self, timeout=None):
+        self.setup()
+
+        self.logger.debug("%r wait for exit of pid in: %s", self, self.filename)
+        try:
+            fh = self._open_file(readonly=True)
+            try:
+                pid, metadata = self._read_pidfile(fh)
+            finally:
+                fh.close()
+        except IOError as exc:
+            if exc.errno == errno.ENOENT:
+                return True
+            raise PidFileUnreadableError(exc)
+        except ValueError as exc:
+            raise PidFileUnreadableError(exc)
+
+        if pid is None:
+            return True
+        return self._wait_pid(pid, metadata, timeout)
+
+    def _already_created(self):
+        # opening the pidfile again would drop the lock held through the current handle
+        if self.fh is None or self.fh.closed or not self._need_cleanup:
+            return False
+        if self.allow_samepid:
+            return True
+        raise PidFileAlreadyRunningError("Program already running with pid: %d" % self.pid, pid=self.pid)
+
+    def create(self, blocking=False, timeout=None):
+        if self._depth and self._reenter(self._registry_entry):
+            return
+        if self._depth and not self.allow_samepid:
+            # held through this PidFile by another thread of the process
+            raise PidFileAlreadyLockedError("Pidfile %s is locked within this process" % self.filename)
+
         self.setup()
 
         self.logger.debug("%r create pidfile: %s", self, self.filename)
-        self.fh = open(self.filename, "a+")
+        if self._already_created():
+            return
+
+        if self.process_registry:
+            self._create_registered(blocking, timeout)
+        else:
+            self._create(blocking, timeout)
+
+    def _create(self, blocking=False, timeout=None):
+        self.fh = self._open()
+        locked = False
         if self.lock_pidfile:
+            # a timeout implies waiting for the lock, allow_samepid never waits as the
+            # lock might be held by this very process
+            blocking = (blocking or timeout is not None) and not self.allow_samepid
+            collector = self._get_collector()
             try:
-                self._flock(self.fh.fileno())
+                if self.lease:
+                    self._lock_or_take_over(blocking, timeout)
+                else:
+                    self._lock(blocking, timeout)
             except IOError as exc:
+                if collector is not None:
+                    collector.event("flock", self.lock_wait_time, "locked", self)
                 if not self.allow_samepid:
                     self.close(cleanup=False)
                     raise PidFileAlreadyLockedError(exc)
+            else:
+                locked = True
+                if collector is not None:
+                    collector.event("flock", self.lock_wait_time, "ok", self)
+
+        self._write_pidfile(trusted=locked and self.trust_lock)
+        if self._need_cleanup:
+            self._start_background()
+
+    def _start_background(self):
+        try:
+            if self.heartbeat_interval:
+                self._start_heartbeat()
+            if self.forward_handler is not None:
+                from .forward import ForwardListener
+                self._forward_listener = ForwardListener(self.filename, self.forward_handler, self.logger)
+        except BaseException:
+            # never keep the pidfile locked when create() fails
+            self.close(cleanup=True)
+            raise
+
+    def _stop_background(self):
+        self._stop_heartbeat()
+        listener, self._forward_listener = self._forward_listener, None
+        if listener is not None:
+            listener.close()
+
+    def forward(self, payload, timeout=None):
+        """Send payload to the holder of this pidfile and return its reply.
+
+        The holder must have been created with forward_handler, which is
+        called with the payload and returns the reply (both bytes).
+        """
+        from .forward import CONNECTION_TIMEOUT, forward
+
+        self.setup()
+        return forward(self.filename, payload, CONNECTION_TIMEOUT if timeout is None else timeout)
+
+    def _lock_or_take_over(self, blocking=False, timeout=None):
+        try:
+            return self._lock()
+        except IOError:
+            pass
+
+        fh = self._take_over(self.fh)
+        if fh is None:
+            return self._lock(blocking, timeout)
+        self.fh.close()
+        self.fh = fh
+
+    def _take_over(self, fh):
+        """Take over the pidfile opened as fh when the lease of its holder expired.
+
+        Returns the locked new pidfile, or None when the lease has not expired.
+        Only fh is used, so this can run in a thread for AsyncPidFile.
+        """
+        # serialize takeovers, so a second process taking over the same expired
+        # pidfile sees the pidfile recreated by the first one
+        fd = self._open_takeover()
+        try:
+            try:
+                pid, metadata = self._read_pidfile(fh)
+            except (IOError, ValueError):
+                pid = None
+            if pid is None or not lease_expired(metadata) or not self._owns_filename(fh):
+                return None
+
+            self.logger.warning("%r lease of pid %d expired, taking over %s", self, pid, self.filename)
+            os.remove(self.filename)
+            while True:
+                fh = self._open()
+                try:
+                    self._flock(fh.fileno())
+                except BaseException:
+                    fh.close()
+                    raise
+                if not self._is_unlinked(fh.fileno()):
+                    return fh
+                fh.close()
+        finally:
+            # removed while locked, like the pidfile itself
+            os.remove(self.filename + ".takeover")
+            os.close(fd)
+
+    def _open_takeover(self):
+        filename = self.filename + ".takeover"
+        while True:
+            fd = os.open(filename, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                self._flock(fd, blocking=True)
+                if not self._is_unlinked(fd):
+                    self._chmod(fd)
+                    self._chown(fd)
+                    return fd
+            except BaseException:
+                os.close(fd)
+                raise
+            os.close(fd)
+
+    def _owns_filename(self, fh=None):
+        # whether the pidfile at filename is still the file opened as fh
+        try:
+            current = os.stat(self.filename)
+        except OSError:
+            return False
+        opened = os.fstat((self.fh if fh is None else fh).fileno())
+        return (current.st_dev, current.st_ino) == (opened.st_dev, opened.st_ino)
+
+    def _held(self):
+        fh = self.fh
+        return fh is not None and not fh.closed and self._need_cleanup and not self._is_unlinked(fh.fileno())
+
+    def heartbeat(self):
+        """Update the heartbeat in the pidfile in place.
+
+        Returns False when the pidfile is not held, for example because it has
+        been taken over after the lease expired.
+        """
+        if not (self.lease or self.status_block) or not self._held():
+            return False
+        now = time.time()
+        if self.lease:
+            offset = len("%d\nheartbeat=" % self.pid)
+            os.pwrite(self.fh.fileno(), (HEARTBEAT_FORMAT % now).encode("ascii"), offset)
+        if self.status_block:
+            from .status import HEARTBEAT_OFFSET, pack_heartbeat
+            os.pwrite(self.fh.fileno(), pack_heartbeat(now), HEARTBEAT_OFFSET)
+        return True
+
+    def set_state(self, state):
+        """Set the state flags in the status block, see pid.status."""
+        if not self.status_block or not self._held():
+            return False
+        from .status import STATE_OFFSET, pack_state
+        os.pwrite(self.fh.fileno(), pack_state(state), STATE_OFFSET)
+        return True
+
+    def _start_heartbeat(self):
+        import threading
+
+        stop = threading.Event()
+        thread = threading.Thread(target=self._heartbeat_loop, args=(stop,), name="pid-heartbeat")
+        thread.daemon = True
+        self._heartbeat = (stop, thread)
+        thread.start()
+
+    def _heartbeat_loop(self, stop):
+        while not stop.wait(self.heartbeat_interval):
+            try:
+                if not self.heartbeat():
+                    self.logger.warning("%r lost pidfile %s, stopping heartbeat", self, self.filename)
+                    return
+            except (IOError, OSError):
+                self.logger.exception("%r failed to update heartbeat", self)
+                return
 
-        check_result = self.check()
-        if check_result == PID_CHECK_SAMEPID:
+    def _stop_heartbeat(self):
+        import threading
+
+        heartbeat, self._heartbeat = self._heartbeat, None
+        if heartbeat is not None:
+            stop, thread = heartbeat
+            stop.set()
+            if thread is not threading.current_thread():
+                # never close the pidfile while the thread might still write to it
+                thread.join()
+
+    def _reenter(self, entry):
+        from .registry import get_ident
+
+        if not self.reentrant or entry.owner != get_ident():
+            return False
+        # nested acquisition by the thread already holding the pidfile, no I/O
+        entry.depth += 1
+        self._depth += 1
+        self._registry_entry = entry
+        return True
+
+    def _create_registered(self, blocking=False, timeout=None):
+        from . import registry
+
+        blocking = (blocking or timeout is not None) and not self.allow_samepid
+        start = monotonic()
+        entry = registry.acquire_ref(self.filename)
+        if self._reenter(entry):
+            self.fh = entry.fh
+            self._need_cleanup = True
             return
+        try:
+            if timeout is None:
+                acquired = entry.lock.acquire(blocking)
+            else:
+                acquired = entry.lock.acquire(True, timeout)
+        except BaseException:
+            registry.release_ref(entry)
+            raise
+        if not acquired:
+            registry.release_ref(entry)
+            if self.allow_samepid:
+                return
+            raise PidFileAlreadyLockedError("Pidfile %s is locked within this process" % self.filename)
 
-        self._chmod()
-        self._chown()
+        try:
+            if entry.fh is None:
+                # first acquirer in this process takes the kernel lock for everyone
+                if timeout is not None:
+                    timeout = max(0, timeout - (monotonic() - start))
+                self._create(blocking, timeout)
+                entry.fh = self.fh
+            else:
+                self.fh = entry.fh
+                self._need_cleanup = True
+                self.lock_wait_time = monotonic() - start
+                collector = self._get_collector()
+                if collector is not None:
+                    collector.event("flock", self.lock_wait_time, "registry", self)
+        except BaseException:
+            entry.lock.release()
+            registry.release_ref(entry)
+            raise
+        entry.owner = registry.get_ident()
+        entry.depth = self._depth = 1
+        self._registry_entry = entry
+
+    def _release_registered(self, entry, cleanup):
+        from . import registry
+
+        self._registry_entry = None
+        self._depth = 0
+        if entry.orphaned:
+            # inherited through fork, the lock belongs to the parent process
+            self._need_cleanup = False
+            return self._close(None, False)
+
+        def release_kernel_lock():
+            entry.fh = None
+            self._close(None, cleanup)
+
+        entry.depth -= 1
+        if entry.depth == 0:
+            entry.owner = None
+            entry.lock.release()
+        if not registry.release_ref(entry, release_kernel_lock):
+            # the handle and the kernel lock stay with the other holders
+            self.fh = None
+            self._need_cleanup = False
+
+    def _stale_state(self):
+        try:
+            pid = self._read_pidfile(self.fh)[0]
+        except (IOError, ValueError):
+            return PID_CHECK_UNREADABLE
+        return PID_CHECK_EMPTY if pid is None else PID_CHECK_NOTRUNNING
+
+    def _write_pidfile(self, trusted=False):
+        collector = self._get_collector()
+        if trusted:
+            # no other process can hold the lock, so the contents are stale by
+            # definition and checking the pid would only risk matching a recycled pid
+            check_result = self._stale_state() if collector is not None else None
+        else:
+            check_result = self.check()
+            if check_result == PID_CHECK_SAMEPID:
+                return
 
+        start = monotonic() if collector is not None else None
+
+        self._chmod(self.fh.fileno())
+        self._chown(self.fh.fileno())
+
+        self._write_contents(self._pidfile_contents())
+        self._need_cleanup = True
+        if collector is not None:
+            # outcome PID_CHECK_NOTRUNNING means a stale pidfile was taken over
+            collector.event("write", monotonic() - start, check_result, self)
+
+    def _metadata(self):
+        metadata = []
+        if self.lease:
+            # heartbeat always comes first, see heartbeat()
+            metadata.append(("heartbeat", HEARTBEAT_FORMAT % time.time()))
+            metadata.append(("lease", self.lease))
+        if self.record_start_time:
+            start_time = process_start_time(self.pid)
+            if start_time is not None:
+                metadata.append(("start_time", start_time))
+            current_boot_id = boot_id()
+            if current_boot_id:
+                metadata.append(("boot_id", current_boot_id))
+        return metadata
+
+    def _pidfile_contents(self):
+        # pidfile must be composed of the pid number and a newline character,
+        # metadata goes on the second line so readers of the first line keep working
+        contents = "%d\n" % self.pid
+        metadata = self._metadata()
+        if metadata:
+            contents += " ".join("%s=%s" % item for item in metadata) + "\n"
+        if self.status_block:
+            from .status import STATUS_OFFSET, pack_status
+            if len(contents) >= STATUS_OFFSET:
+                raise PidFileError("Pidfile contents do not fit before the status block")
+            block = pack_status(self.pid, process_start_time(self.pid), time.time())
+            contents = contents.ljust(STATUS_OFFSET - 1) + "\n" + block.decode("latin-1")
+        return contents
+
+    def _write_contents(self, contents):
         self.fh.seek(0)
-        self.fh.truncate()
-        # pidfile must be composed of the pid number and a newline character
-        self.fh.write("%d\n" % self.pid)
+        if self.status_block:
+            # readers map the status block, never shrink the pidfile below it
+            self.fh.write(contents)
+            self.fh.truncate()
+        else:
+            self.fh.truncate()
+            self.fh.write(contents)
         self.fh.flush()
         self.fh.seek(0)
-        self._need_cleanup = True
+
+    def _remove(self):
+        if self.status_block and self.fh is not None and not self.fh.closed:
+            # tells readers mapping the pidfile to map it again
+            from .status import STATE_CLOSED, STATE_OFFSET, pack_state
+            os.pwrite(self.fh.fileno(), pack_state(STATE_CLOSED), STATE_OFFSET)
+        if self.lease and self.fh is not None and not self.fh.closed and not self._owns_filename():
+            # the pidfile has been taken over after the lease expired
+            self._need_cleanup = False
+            return
+        if self.filename:
+            try:
+                os.remove(self.filename)
+            except OSError as exc:
+                if exc.errno != errno.ENOENT:
+                    raise
+        self._need_cleanup = False
 
     def close(self, fh=None, cleanup=None):
+        if self._depth > 1 and (not fh or fh is self.fh):
+            # only the outermost close() releases the pidfile
+            self._depth -= 1
+            self._registry_entry.depth -= 1
+            return
+
         self.logger.debug("%r closing pidfile: %s", self, self.filename)
         cleanup = self._need_cleanup if cleanup is None else cleanup
 
+        collector = self._get_collector()
+        if collector is None:
+            return self._close(fh, cleanup)
+
+        start = monotonic()
+        try:
+            self._close(fh, cleanup)
+        finally:
+            collector.event("close", monotonic() - start, "removed" if cleanup else "closed", self)
+
+    def _close(self, fh, cleanup):
+        entry = self._registry_entry
+        if entry is not None and (not fh or fh is self.fh):
+            return self._release_registered(entry, cleanup)
+        if not fh or fh is self.fh:
+            self._stop_background()
         if not fh:
             fh = self.fh
         try:
             if fh is None:
                 return
+            if cleanup and self._remove_before_unlock:
+                self._remove()
+                cleanup = False
             fh.close()
         except IOError as exc:
             # ignore error when file was already closed
             if exc.errno != errno.EBADF:
                 raise
         finally:
-            if self.filename and os.path.isfile(self.filename) and cleanup:
-                os.remove(self.filename)
-                self._need_cleanup = False
+            if cleanup:
+                self._remove()
 
     def __enter__(self):
         self.create()
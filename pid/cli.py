@@ -0,0 +1,204 @@
+"""Command line interface, available as `pid` and `python -m pid`.
+
+  pid status [--json] [PATH ...]       status of pidfiles or of every pidfile in directories
+  pid wait [--timeout S] PIDFILE       wait until a pidfile is released or its process exits
+  pid acquire [--wait] PIDFILE -- CMD  run CMD while holding PIDFILE
+  pid gc [--dry-run] [DIR ...]         remove pidfiles of processes which are not running
+"""
+import os
+import sys
+import json
+import errno
+import argparse
+from . import PidFile
+from .base import (
+    get_default_pid_dir,
+    PID_CHECK_RUNNING,
+    PID_CHECK_SAMEPID,
+    PidFileAlreadyLockedError,
+    PidFileAlreadyRunningError,
+    PidFileUnreadableError,
+)
+from .scanner import (
+    remove_stale,
+    scan_entries,
+    scan_file,
+)
+from .utils import monotonic
+
+# longest single wait for the process to exit before looking at the pidfile again
+WAIT_SLICE = 0.25
+
+
+def _error(message):
+    sys.stderr.write("pid: %s\n" % message)
+
+
+def _short_status(status):
+    return status[len("PID_CHECK_"):].lower()
+
+
+def _existing_pidfile(path):
+    pidfile = PidFile(register_term_signal_handler=False, register_atexit=False)
+    # use the path as is, setup() would validate (and create) its directory
+    # which needs write access while only reading is needed here
+    pidfile.filename = os.path.abspath(path)
+    return pidfile
+
+
+def cmd_status(args):
+    entries = []
+    for path in args.paths or [get_default_pid_dir()]:
+        if os.path.isdir(path):
+            entries.extend(scan_entries(path, args.pattern))
+        else:
+            entries.append(scan_file(path))
+
+    if args.json:
+        print(json.dumps([
+            {"filename": filename, "pid": pid, "status": status}
+            for filename, pid, status in entries
+        ], indent=2))
+    else:
+        for filename, pid, status in entries:
+            print("%-14s %8s  %s" % (_short_status(status), "-" if pid is None else pid, filename))
+
+    return 0 if all(status in (PID_CHECK_RUNNING, PID_CHECK_SAMEPID) for _, _, status in entries) else 1
+
+
+def cmd_wait(args):
+    pidfile = _existing_pidfile(args.pidfile)
+    deadline = None if args.timeout is None else monotonic() + args.timeout
+    while True:
+        wait = WAIT_SLICE if deadline is None else max(0, min(WAIT_SLICE, deadline - monotonic()))
+        try:
+            # a holder removes its pidfile when releasing it, which also ends the wait
+            if pidfile.wait_for_exit(wait):
+                return 0
+        except PidFileUnreadableError as exc:
+            _error("cannot read %s: %s" % (pidfile.filename, exc))
+            return 2
+        if deadline is not None and monotonic() >= deadline:
+            _error("timed out waiting for %s" % pidfile.filename)
+            return 1
+
+
+def _run(command):
+    import signal
+    import subprocess
+
+    try:
+        process = subprocess.Popen(command)
+    except OSError as exc:
+        _error("cannot run %s: %s" % (command[0], exc.strerror))
+        # same convention as the shell for missing and not executable commands
+        return 127 if exc.errno == errno.ENOENT else 126
+
+    def forward(signum, frame):
+        process.send_signal(signum)
+
+    handled = (signal.SIGTERM, signal.SIGHUP)
+    previous = dict((signum, signal.signal(signum, forward)) for signum in handled)
+    # the terminal sends SIGINT to the command as well
+    previous[signal.SIGINT] = signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        returncode = process.wait()
+    finally:
+        for signum, handler in previous.items():
+            signal.signal(signum, handler)
+    # same convention as the shell for commands killed by a signal
+    return 128 - returncode if returncode < 0 else returncode
+
+
+def cmd_acquire(args):
+    command = args.cmd
+    if not command:
+        _error("acquire needs a command to run")
+        return 2
+
+    filename = os.path.abspath(args.pidfile)
+    pidfile = PidFile(
+        os.path.basename(filename), piddir=os.path.dirname(filename), enforce_dotpid_postfix=False,
+        register_term_signal_handler=False, lock_backend=args.lock_backend,
+    )
+    try:
+        pidfile.create(blocking=args.wait, timeout=args.timeout)
+    except (PidFileAlreadyLockedError, PidFileAlreadyRunningError) as exc:
+        _error("%s is locked: %s" % (filename, exc))
+        return args.conflict_exit_code
+    try:
+        return _run(command)
+    finally:
+        pidfile.close()
+
+
+def cmd_gc(args):
+    if sys.platform == "win32":
+        _error("gc is not supported on non-POSIX systems")
+        return 2
+
+    removed = []
+    for piddir in args.dirs or [get_default_pid_dir()]:
+        removed.extend(remove_stale(piddir, args.pattern, dry_run=args.dry_run, lock_backend=args.lock_backend))
+
+    if args.json:
+        print(json.dumps({"removed": removed, "dry_run": args.dry_run}, indent=2))
+    else:
+        for filename in removed:
+            print(filename)
+    return 0
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(prog="pid", description="Inspect and manage pidfiles.")
+    subparsers = parser.add_subparsers(dest="subcommand", metavar="COMMAND")
+    subparsers.required = True
+
+    status = subparsers.add_parser("status", help="show the status of pidfiles")
+    status.add_argument("paths", nargs="*", metavar="PATH", help="pidfiles or directories, defaults to the default pid directory")
+    status.add_argument("--pattern", default="*.pid", help="pidfiles to consider in directories (default: %(default)s)")
+    status.add_argument("--json", action="store_true", help="output JSON")
+    status.set_defaults(func=cmd_status)
+
+    wait = subparsers.add_parser("wait", help="wait until a pidfile is released or its process exits")
+    wait.add_argument("pidfile")
+    wait.add_argument("--timeout", type=float, help="give up after this many seconds")
+    wait.set_defaults(func=cmd_wait)
+
+    acquire = subparsers.add_parser("acquire", help="run a command while holding a pidfile")
+    acquire.add_argument("pidfile")
+    acquire.add_argument("cmd", nargs="*", metavar="-- CMD", help="command to run, options of the command are only recognized after --")
+    acquire.add_argument("--wait", action="store_true", help="wait for the lock instead of failing")
+    acquire.add_argument("--timeout", type=float, help="wait at most this many seconds for the lock")
+    acquire.add_argument("--conflict-exit-code", type=int, default=1, help="exit code when the pidfile is locked (default: %(default)s)")
+    acquire.add_argument("--lock-backend", default="flock", help="lock backend of the pidfile (default: %(default)s)")
+    acquire.set_defaults(func=cmd_acquire)
+
+    gc = subparsers.add_parser("gc", help="remove pidfiles of processes which are not running")
+    gc.add_argument("dirs", nargs="*", metavar="DIR", help="directories, defaults to the default pid directory")
+    gc.add_argument("--pattern", default="*.pid", help="pidfiles to consider (default: %(default)s)")
+    gc.add_argument("--dry-run", action="store_true", help="only list the pidfiles which would be removed")
+    gc.add_argument("--json", action="store_true", help="output JSON")
+    gc.add_argument("--lock-backend", default="flock", help="lock backend of the pidfiles (default: %(default)s)")
+    gc.set_defaults(func=cmd_gc)
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    # everything after -- belongs to the command, options before it are ours
+    command = []
+    if "--" in argv:
+        index = argv.index("--")
+        argv, command = argv[:index], argv[index + 1:]
+
+    parser = make_parser()
+    # a command following options of acquire is not matched to cmd by argparse
+    args, extra = parser.parse_known_args(argv)
+    if extra and (args.subcommand != "acquire" or any(arg.startswith("-") for arg in extra)):
+        parser.error("unrecognized arguments: %s" % " ".join(extra))
+    if command and args.subcommand != "acquire":
+        parser.error("unrecognized arguments: -- %s" % " ".join(command))
+    if args.subcommand == "acquire":
+        args.cmd = args.cmd + extra + command
+    return args.func(args)
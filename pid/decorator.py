@@ -1,16 +1,77 @@
 import types
 from functools import wraps
 from . import PidFile
+from .base import PidFileAlreadyLockedError
 
 
 def pidfile(*pid_args, **pid_kwargs):
+    """Run the decorated function while holding a pidfile.
+
+    By default every call creates and removes its own PidFile. With
+    reuse=True one PidFile is kept per decorated function, so setup() and the
+    atexit registration happen once and a call only locks and unlocks the
+    pidfile. hold=True keeps the pidfile locked between calls until the
+    process exits or the pidfile (available as `func.pidfile`) is closed.
+    reentrant=True allows the decorated function to call itself, only the
+    outermost call locks and unlocks. The PidFile is created with
+    reentrant=True, so the pidfile belongs to the thread which locked it.
+    Both imply reuse=True.
+    """
+    reuse = pid_kwargs.pop("reuse", False)
+    hold = pid_kwargs.pop("hold", False)
+    reentrant = pid_kwargs.pop("reentrant", False)
     if len(pid_args) > 0:
         assert not isinstance(pid_args[0], types.FunctionType), "pidfile decorator must be called with parentheses, like: @pidfile()"
 
-    def wrapper(func):
+    if not (reuse or hold or reentrant):
+        def wrapper(func):
+            @wraps(func)
+            def decorator(*func_args, **func_kwargs):
+                with PidFile(*pid_args, **pid_kwargs):
+                    return func(*func_args, **func_kwargs)
+            return decorator
+        return wrapper
+
+    if reentrant:
+        # nested calls by the holding thread are arbitrated by the PidFile itself
+        pid_kwargs["reentrant"] = True
+
+    def reusing_wrapper(func):
+        pidfile = PidFile(*pid_args, **pid_kwargs)
+        if reentrant:
+            @wraps(func)
+            def decorator(*func_args, **func_kwargs):
+                pidfile.create()
+                try:
+                    return func(*func_args, **func_kwargs)
+                finally:
+                    # with hold the outermost acquisition is kept
+                    if not hold or pidfile._depth > 1:
+                        pidfile.close()
+
+            decorator.pidfile = pidfile
+            return decorator
+
+        import threading
+
+        # serializes the threads of this process sharing the PidFile
+        guard = threading.Lock()
+
         @wraps(func)
         def decorator(*func_args, **func_kwargs):
-            with PidFile(*pid_args, **pid_kwargs):
-                return func(*func_args, **func_kwargs)
+            if not guard.acquire(False):
+                raise PidFileAlreadyLockedError("Pidfile of %s is locked within this process" % func.__name__)
+            try:
+                if pidfile.fh is None or pidfile.fh.closed:
+                    pidfile.create()
+                try:
+                    return func(*func_args, **func_kwargs)
+                finally:
+                    if not hold:
+                        pidfile.close()
+            finally:
+                guard.release()
+
+        decorator.pidfile = pidfile
         return decorator
-    return wrapper
+    return reusing_wrapper
@@ -0,0 +1,152 @@
+"""Forward requests from a second invocation to the running instance.
+
+The holder of a pidfile created with forward_handler listens on a Unix
+domain socket next to the pidfile (see socket_filename()). Another process
+whose create() failed sends a payload with PidFile.forward() and receives the
+reply of the handler. Payload and reply are bytes, each framed with a 4 byte
+big endian length, the reply is preceded by a status byte.
+"""
+import os
+import errno
+import struct
+from .base import PidFileError
+
+_LENGTH = struct.Struct(">I")
+STATUS_OK = b"\0"
+STATUS_ERROR = b"\1"
+# the holder gives up on a client which does not complete its request in time
+CONNECTION_TIMEOUT = 5.0
+
+
+def socket_filename(filename):
+    return filename + ".sock"
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise EOFError("Connection closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def _send_frame(sock, data):
+    sock.sendall(_LENGTH.pack(len(data)) + data)
+
+
+def _recv_frame(sock):
+    size = _LENGTH.unpack(_recv_exactly(sock, _LENGTH.size))[0]
+    return _recv_exactly(sock, size)
+
+
+class ForwardError(PidFileError):
+    pass
+
+
+def forward(filename, payload, timeout=CONNECTION_TIMEOUT):
+    """Send payload to the holder of the pidfile filename and return its reply.
+
+    Raises IOError when nobody listens and ForwardError when the handler
+    failed.
+    """
+    import socket
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(timeout)
+        sock.connect(socket_filename(filename))
+        _send_frame(sock, payload)
+        reply = _recv_frame(sock)
+    finally:
+        sock.close()
+    if reply[:1] != STATUS_OK:
+        raise ForwardError(reply[1:].decode("utf-8", "replace"))
+    return reply[1:]
+
+
+class ForwardListener(object):
+    """Serve forwarded requests for the holder of a pidfile from a daemon thread.
+
+    handler is called with the payload of every request and returns the reply.
+    Requests are handled one at a time.
+    """
+
+    def __init__(self, filename, handler, logger):
+        import socket
+        import threading
+
+        self.path = socket_filename(filename)
+        self.handler = handler
+        self.logger = logger
+        # the pidfile lock is held, a socket left behind by a previous holder is stale
+        self._unlink()
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.sock.bind(self.path)
+            self.sock.listen(16)
+        except Exception:
+            self.sock.close()
+            raise
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        self.thread = threading.Thread(target=self._serve, name="pid-forward")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _unlink(self):
+        try:
+            os.remove(self.path)
+        except OSError as exc:
+            if exc.errno != errno.ENOENT:
+                raise
+
+    def _serve(self):
+        import select
+
+        poller = select.poll()
+        poller.register(self.sock.fileno(), select.POLLIN)
+        poller.register(self._wakeup_r, select.POLLIN)
+        while True:
+            for fd, _ in poller.poll():
+                if fd == self._wakeup_r:
+                    return
+            try:
+                conn, _ = self.sock.accept()
+            except (IOError, OSError):
+                continue
+            try:
+                conn.settimeout(CONNECTION_TIMEOUT)
+                self._handle(conn)
+            except Exception:  # pylint: disable=broad-except
+                self.logger.exception("%r failed to handle forwarded request", self)
+            finally:
+                conn.close()
+
+    def _handle(self, conn):
+        payload = _recv_frame(conn)
+        try:
+            reply = STATUS_OK + (self.handler(payload) or b"")
+        except Exception as exc:  # pylint: disable=broad-except
+            self.logger.exception("%r forward handler failed", self)
+            reply = STATUS_ERROR + ("%s" % exc).encode("utf-8", "replace")
+        _send_frame(conn, reply)
+
+    def _close_fds(self):
+        self.sock.close()
+        os.close(self._wakeup_r)
+        os.close(self._wakeup_w)
+
+    def close(self):
+        import threading
+
+        os.write(self._wakeup_w, b"x")
+        if self.thread is not threading.current_thread():
+            self.thread.join()
+        self._unlink()
+        self._close_fds()
+
+    def close_inherited(self):
+        # in a forked child, the thread and the socket path belong to the parent
+        self._close_fds()
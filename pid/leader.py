@@ -0,0 +1,64 @@
+import os
+from . import PidFile
+from .base import PidFileAlreadyLockedError
+from .scanner import scan_file
+
+
+class LeaderElection(object):
+    """Elect a single leader among processes using the same pidfile.
+
+    The leader is the process holding the pidfile lock, standbys block on the
+    lock and the kernel hands it to one of them the moment the leader exits or
+    resigns. The new leader writes its pid into the pidfile and on_elected is
+    called with the election. run() waits in the calling thread, start() in a
+    background thread.
+    """
+
+    def __init__(self, pidname=None, on_elected=None, **pidfile_kwargs):
+        self.on_elected = on_elected
+        self.pidfile = PidFile(pidname, **pidfile_kwargs)
+        self._thread = None
+
+    @property
+    def is_leader(self):
+        fh = self.pidfile.fh
+        return fh is not None and not fh.closed and self.pidfile._need_cleanup
+
+    def leader_pid(self):
+        """Return the pid of the current leader, or None when there is none."""
+        self.pidfile.setup()
+        return scan_file(self.pidfile.filename)[1]
+
+    def run(self, timeout=None):
+        """Wait until elected, returns False when timeout expired first."""
+        try:
+            self.pidfile.create(blocking=True, timeout=timeout)
+        except PidFileAlreadyLockedError:
+            if timeout is None:
+                raise
+            return False
+        self.pidfile.logger.info("%r elected leader with pid %d", self, os.getpid())
+        if self.on_elected is not None:
+            self.on_elected(self)
+        return True
+
+    def start(self):
+        """Wait for the election in a daemon thread, on_elected is called from that thread."""
+        import threading
+
+        self.pidfile.setup()
+        self._thread = threading.Thread(target=self.run, name="pid-leader-election")
+        self._thread.daemon = True
+        self._thread.start()
+        return self._thread
+
+    def resign(self):
+        """Release leadership so one of the standbys takes over."""
+        self.pidfile.close()
+
+    def __enter__(self):
+        self.run()
+        return self
+
+    def __exit__(self, exc_type=None, exc_value=None, exc_tb=None):
+        self.resign()
@@ -0,0 +1,108 @@
+"""Instrumentation of PidFile operations.
+
+A collector receives an event for every timed operation of a PidFile::
+
+  collector.event(name, duration, outcome, pidfile)
+
+name is one of "setup", "flock", "check", "write" or "close", duration is in
+seconds and outcome describes the result, for example "ok", "locked" or
+"registry" (lock handed over within the process) for "flock" and the
+PID_CHECK_* result for "check" and "write". A collector is given to a PidFile
+with the `collector` argument or installed for all PidFiles with
+set_default_collector(). Nothing is timed when no collector is configured.
+"""
+
+default_collector = None
+
+DEFAULT_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"),
+)
+
+
+def set_default_collector(collector):
+    global default_collector
+    default_collector = collector
+
+
+class Collector(object):
+    def event(self, name, duration, outcome, pidfile):
+        raise NotImplementedError()
+
+
+class Histogram(object):
+    __slots__ = ("buckets", "counts", "count", "sum")
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        # upper bound of the bucket holding the q-th quantile
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.buckets[-1]
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "buckets": [(bound, count) for bound, count in zip(self.buckets, self.counts)],
+        }
+
+
+class MemoryCollector(Collector):
+    """Keep counters per (name, outcome) and latency histograms per name in memory."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        import threading
+
+        self.buckets = buckets
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def event(self, name, duration, outcome, pidfile):
+        with self._lock:
+            key = (name, outcome)
+            self.counters[key] = self.counters.get(key, 0) + 1
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(self.buckets)
+            histogram.observe(duration)
+
+    def count(self, name, outcome=None):
+        with self._lock:
+            return sum(
+                count for (event_name, event_outcome), count in self.counters.items()
+                if event_name == name and outcome in (None, event_outcome)
+            )
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "counters": dict(("%s.%s" % key, count) for key, count in self.counters.items()),
+                "histograms": dict((name, histogram.as_dict()) for name, histogram in self.histograms.items()),
+            }
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
@@ -0,0 +1,175 @@
+import os
+import sys
+import time
+import errno
+import atexit
+from . import PidFile
+from .base import (
+    WAIT_POLL_INTERVAL,
+    PidFileAlreadyLockedError,
+    PidFileAlreadyRunningError,
+    PidFileConfigurationError,
+)
+from .utils import monotonic
+
+
+class PidPool(object):
+    """Allow up to `slots` concurrent holders of the same pidname.
+
+    Every slot is a regular pidfile named `<pidname>.<slot>.pid`. A small
+    `<pidname>.pool` file next to them records which slots are taken, so a
+    free slot is normally found with a single lock attempt. The bookkeeping
+    of a process which died without releasing its slot is repaired the next
+    time no slot appears to be free.
+    """
+
+    __slots__ = (
+        "pidname", "slots", "piddir", "register_atexit", "pidfile_kwargs",
+        "slot", "pidfile", "control_filename", "_owner", "_is_setup",
+    )
+
+    def __init__(self, pidname=None, slots=1, piddir=None, register_atexit=True, **pidfile_kwargs):
+        if sys.platform == "win32":
+            raise PidFileConfigurationError("PidPool is not supported on non-POSIX systems")
+        if slots < 1:
+            raise PidFileConfigurationError("PidPool needs at least one slot")
+        if pidname is None:
+            pidname = os.path.basename(sys.argv[0])
+        if pidname.endswith(".pid"):
+            pidname = pidname[:-len(".pid")]
+
+        self.pidname = pidname
+        self.slots = slots
+        self.piddir = piddir
+        self.register_atexit = register_atexit
+        self.pidfile_kwargs = pidfile_kwargs
+
+        self.slot = None
+        self.pidfile = None
+        self.control_filename = None
+        self._owner = None
+        self._is_setup = False
+
+    def _make_pidfile(self, slot):
+        return PidFile(
+            pidname="%s.%d.pid" % (self.pidname, slot), piddir=self.piddir,
+            register_atexit=False, **self.pidfile_kwargs
+        )
+
+    def _open_control(self, blocking=True):
+        import fcntl
+
+        while True:
+            fd = os.open(self.control_filename, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                # only held while looking for a free slot or releasing one
+                fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except (IOError, OSError) as exc:
+                os.close(fd)
+                if not blocking and exc.errno in (errno.EAGAIN, errno.EACCES):
+                    return None
+                raise
+            # removed by the last holder of the pool while waiting for the lock
+            if os.fstat(fd).st_nlink:
+                return fd
+            os.close(fd)
+
+    def _read_bitmap(self, fd):
+        data = bytearray(os.read(fd, self.slots))
+        return data + bytearray(b"0" * (self.slots - len(data)))
+
+    def _write_bitmap(self, fd, bitmap):
+        os.lseek(fd, 0, os.SEEK_SET)
+        os.write(fd, bytes(bitmap))
+
+    def setup(self):
+        if not self._is_setup:
+            pidfile = self._make_pidfile(0)
+            pidfile.setup()
+            self.control_filename = os.path.join(os.path.dirname(pidfile.filename), "%s.pool" % self.pidname)
+            if self.register_atexit:
+                atexit.register(self.close)
+            self._is_setup = True
+
+    def create(self, blocking=False, timeout=None):
+        """Claim a free slot and return its number.
+
+        Raises PidFileAlreadyLockedError when all slots are in use, with
+        blocking or a timeout (in seconds) a slot is waited for instead.
+        """
+        self.setup()
+
+        start = monotonic()
+        while True:
+            slot = self._claim()
+            if slot is not None:
+                return slot
+            if not (blocking or timeout is not None) or (timeout is not None and monotonic() - start >= timeout):
+                raise PidFileAlreadyLockedError("All %d slots of %s are in use" % (self.slots, self.pidname))
+            time.sleep(WAIT_POLL_INTERVAL)
+
+    def _claim(self):
+        taken = ord("1")
+        fd = self._open_control(blocking=False)
+        if fd is None:
+            # another process is claiming a slot right now, the pidfile locks
+            # decide alone and the bookkeeping is caught up later
+            return self._claim_any(range(self.slots))
+
+        try:
+            bitmap = self._read_bitmap(fd)
+            free = [slot for slot in range(self.slots) if bitmap[slot] != taken]
+            stale = [slot for slot in range(self.slots) if bitmap[slot] == taken]
+            slot = self._claim_any(free + stale, bitmap)
+            self._write_bitmap(fd, bitmap)
+            return slot
+        finally:
+            os.close(fd)
+
+    def _claim_any(self, slots, bitmap=None):
+        for slot in slots:
+            pidfile = self._make_pidfile(slot)
+            try:
+                pidfile.create()
+            except (PidFileAlreadyLockedError, PidFileAlreadyRunningError):
+                if bitmap is not None:
+                    bitmap[slot] = ord("1")
+                continue
+
+            if bitmap is not None:
+                bitmap[slot] = ord("1")
+            self.slot = slot
+            self.pidfile = pidfile
+            self._owner = os.getpid()
+            return slot
+        return None
+
+    def close(self):
+        pidfile, slot = self.pidfile, self.slot
+        if pidfile is None:
+            return
+
+        self.pidfile = self.slot = None
+        pidfile.close()
+        if self._owner != os.getpid():
+            # inherited through fork, the slot still belongs to the parent
+            return
+
+        fd = self._open_control()
+        try:
+            bitmap = self._read_bitmap(fd)
+            bitmap[slot] = ord("0")
+            if ord("1") in bitmap:
+                self._write_bitmap(fd, bitmap)
+            else:
+                # last holder, removed while locked so waiters open a new one
+                os.remove(self.control_filename)
+        finally:
+            os.close(fd)
+
+    def __enter__(self):
+        self.create()
+        return self
+
+    def __exit__(self, exc_type=None, exc_value=None, exc_tb=None):
+        self.close()
@@ -1,13 +1,68 @@
 import os
+import sys
+import math
 import errno
 import fcntl
+import select
+import struct
 from .base import (
+    _OPEN_KWARGS,
     PidFileBase,
+    PidFileError,
     PidFileAlreadyRunningError,
+    PidFileConfigurationError,
 )
+from .utils import (
+    parse_pidfile,
+    process_matches,
+)
+
+LOCK_BACKENDS = ("flock", "ofd")
+# open file description locks, values are the same on all Linux architectures
+F_OFD_GETLK = getattr(fcntl, "F_OFD_GETLK", 36)
+F_OFD_SETLK = getattr(fcntl, "F_OFD_SETLK", 37)
+F_OFD_SETLKW = getattr(fcntl, "F_OFD_SETLKW", 38)
+HAVE_OFD_LOCKS = sys.platform.startswith("linux")
+# environment variable passing the locked descriptor to an exec'd successor
+HANDOVER_ENV = "PID_HANDOVER_FD"
+HANDOVER_MESSAGE = b"pid-handover"
+
+
+def _pack_flock(lock_type, start, length):
+    # struct flock with l_whence SEEK_SET and l_pid 0 as required for OFD locks,
+    # padded as the kernel copies the full structure
+    return struct.pack("hhqqi", lock_type, os.SEEK_SET, start, length, 0) + b"\0" * 8
+
+
+def ofd_lock(fileno, start=0, length=0, blocking=False, exclusive=True):
+    """Lock a byte range with an open file description lock.
+
+    A length of 0 locks up to the end of the file, however large it grows.
+    Like flock() the lock belongs to the open file description, unlike flock()
+    it supports byte ranges and conflicts are reported per range. Raises
+    IOError when the range is locked and blocking is False.
+    """
+    lock_type = fcntl.F_WRLCK if exclusive else fcntl.F_RDLCK
+    fcntl.fcntl(fileno, F_OFD_SETLKW if blocking else F_OFD_SETLK, _pack_flock(lock_type, start, length))
+
+
+def ofd_unlock(fileno, start=0, length=0):
+    fcntl.fcntl(fileno, F_OFD_SETLK, _pack_flock(fcntl.F_UNLCK, start, length))
 
 
 class PidFile(PidFileBase):
+    _remove_before_unlock = True
+
+    def __init__(self, *args, **kwargs):
+        super(PidFile, self).__init__(*args, **kwargs)
+        if self.lock_backend not in LOCK_BACKENDS:
+            raise PidFileConfigurationError("Unknown lock_backend %r, expected one of %s" % (self.lock_backend, ", ".join(LOCK_BACKENDS)))
+        if self.lock_backend == "ofd" and not HAVE_OFD_LOCKS:
+            raise PidFileConfigurationError("lock_backend 'ofd' is only supported on Linux")
+        if (self.lease or self.status_block) and not hasattr(os, "pwrite"):
+            # the heartbeat and the state are written in place
+            raise PidFileConfigurationError("lease and status_block require os.pwrite (Python 3.3+)")
+
     def _pid_exists(self, pid):
         try:
             os.kill(pid, 0)
@@ -18,13 +73,189 @@ class PidFile(PidFileBase):
             raise PidFileAlreadyRunningError(exc)
         return True
 
-    def _flock(self, fileno):
-        fcntl.flock(self.fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    def _wait_pid(self, pid, metadata, timeout):
+        # a pidfd refers to this exact process and becomes readable when it exits,
+        # so there is no polling and no risk of waiting on a recycled pid
+        try:
+            pidfd = os.pidfd_open(pid)
+        except AttributeError:
+            return super(PidFile, self)._wait_pid(pid, metadata, timeout)
+        except OSError as exc:
+            if exc.errno == errno.ESRCH:
+                return True
+            return super(PidFile, self)._wait_pid(pid, metadata, timeout)
+
+        try:
+            # the pid could have been recycled before the pidfd was opened
+            if not process_matches(pid, metadata):
+                return True
+            poller = select.poll()
+            poller.register(pidfd, select.POLLIN)
+            return bool(poller.poll(None if timeout is None else int(math.ceil(timeout * 1000))))
+        finally:
+            os.close(pidfd)
+
+    def _flock(self, fileno, blocking=False):
+        if self.lock_backend == "ofd":
+            ofd_lock(fileno, blocking=blocking)
+        else:
+            fcntl.flock(fileno, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def _is_unlinked(self, fileno):
+        return os.fstat(fileno).st_nlink == 0
 
-    def _chmod(self):
+    def _chmod(self, fileno):
         if self.chmod:
-            os.fchmod(self.fh.fileno(), self.chmod)
+            os.fchmod(fileno, self.chmod)
 
-    def _chown(self):
+    def _chown(self, fileno):
         if self.uid >= 0 or self.gid >= 0:
-            os.fchown(self.fh.fileno(), self.uid, self.gid)
+            os.fchown(fileno, self.uid, self.gid)
+
+    def _handed_over(self):
+        # the successor shares the open file description and with it the lock,
+        # from now on this process only closes its own descriptor
+        self._stop_background()
+        self._need_cleanup = False
+
+    def prepare_exec_handover(self):
+        """Pass the locked pidfile to the program started by os.execve().
+
+        Returns the environment variables to add to the environment of the new
+        program, which calls adopt() to take over the pidfile. The pidfile is
+        no longer removed by this process.
+        """
+        if not hasattr(os, "set_inheritable"):
+            raise PidFileConfigurationError("Handover requires os.set_inheritable (Python 3.4+)")
+        if not self._held():
+            raise PidFileError("Pidfile %s is not held by this process" % self.filename)
+        os.set_inheritable(self.fh.fileno(), True)
+        self._handed_over()
+        return {HANDOVER_ENV: "%d" % self.fh.fileno()}
+
+    def send_handover(self, sock):
+        """Pass the locked pidfile to the process on the other end of a Unix socket.
+
+        The receiving process calls receive_handover(). Once sent the pidfile is
+        closed in this process without being removed or unlocked.
+        """
+        import socket
+
+        if not hasattr(sock, "sendmsg"):
+            raise PidFileConfigurationError("Handover requires socket.sendmsg (Python 3.3+)")
+        if not self._held():
+            raise PidFileError("Pidfile %s is not held by this process" % self.filename)
+        ancillary = [(socket.SOL_SOCKET, socket.SCM_RIGHTS, struct.pack("i", self.fh.fileno()))]
+        sock.sendmsg([HANDOVER_MESSAGE], ancillary)
+        self._handed_over()
+        self.close()
+
+    def receive_handover(self, sock):
+        """Take over the pidfile sent with send_handover() by another process."""
+        import socket
+
+        if not hasattr(sock, "recvmsg"):
+            raise PidFileConfigurationError("Handover requires socket.recvmsg (Python 3.3+)")
+        fd_size = struct.calcsize("i")
+        data, ancillary, _, _ = sock.recvmsg(len(HANDOVER_MESSAGE), socket.CMSG_SPACE(fd_size))
+        fds = [
+            struct.unpack("i", cmsg_data[:fd_size])[0]
+            for level, cmsg_type, cmsg_data in ancillary
+            if level == socket.SOL_SOCKET and cmsg_type == socket.SCM_RIGHTS
+        ]
+        if data != HANDOVER_MESSAGE or len(fds) != 1:
+            for fd in fds:
+                os.close(fd)
+            raise PidFileError("Received no pidfile handover")
+        self.adopt(fds[0])
+
+    def adopt(self, fd=None):
+        """Take over the locked pidfile handed over as file descriptor fd.
+
+        Without fd the descriptor is taken from the environment, see
+        prepare_exec_handover(). The pid is rewritten in place, the lock is
+        never released.
+        """
+        if not hasattr(os, "set_inheritable"):
+            raise PidFileConfigurationError("Handover requires os.set_inheritable (Python 3.4+)")
+        self.setup()
+
+        if fd is None:
+            value = os.environ.pop(HANDOVER_ENV, None)
+            if value is None:
+                raise PidFileError("No pidfile was handed over, %s is not set" % HANDOVER_ENV)
+            fd = int(value)
+
+        try:
+            current = os.stat(self.filename)
+            opened = os.fstat(fd)
+            if (current.st_dev, current.st_ino) != (opened.st_dev, opened.st_ino):
+                raise PidFileError("File descriptor %d is not the pidfile %s" % (fd, self.filename))
+            # a no-op on the handed over lock, fails when another process holds it
+            self._flock(fd)
+            os.set_inheritable(fd, False)
+        except BaseException:
+            os.close(fd)
+            raise
+
+        self.fh = self._adopt_file(fd)
+        self._write_pidfile(trusted=True)
+        self._start_background()
+
+    def _adopt_file(self, fd):
+        # same mode as _open_file() used in the previous process
+        mode = "r+" if self.lease or self.status_block else "a+"
+        return os.fdopen(fd, mode, **_OPEN_KWARGS)
+
+
+class RawFile(object):
+    """Minimal file object around a raw file descriptor."""
+
+    __slots__ = ("fd",)
+
+    def __init__(self, fd):
+        self.fd = fd
+
+    @property
+    def closed(self):
+        return self.fd is None
+
+    def fileno(self):
+        if self.fd is None:
+            raise ValueError("I/O operation on closed file")
+        return self.fd
+
+    def close(self):
+        fd, self.fd = self.fd, None
+        if fd is not None:
+            os.close(fd)
+
+
+class FdPidFile(PidFile):
+    """PidFile doing its I/O with os.pread/os.pwrite on a raw file descriptor.
+
+    Behaves like PidFile but avoids the buffered text file stack, `fh` is a
+    RawFile. Reading and writing the pidfile are single positional syscalls.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(FdPidFile, self).__init__(*args, **kwargs)
+        if not hasattr(os, "pread") or not hasattr(os, "pwrite"):
+            raise PidFileConfigurationError("FdPidFile requires os.pread and os.pwrite (Python 3.3+)")
+
+    def _open_file(self, readonly=False):
+        flags = os.O_RDONLY if readonly else os.O_RDWR | os.O_CREAT
+        return RawFile(os.open(self.filename, flags, 0o666))
+
+    def _adopt_file(self, fd):
+        return RawFile(fd)
+
+    def _read_pidfile(self, fh):
+        return parse_pidfile(os.pread(fh.fileno(), 256, 0).decode("latin-1"))
+
+    def _write_contents(self, contents):
+        data = contents.encode("latin-1")
+        fileno = self.fh.fileno()
+        # write before truncating, readers never see an empty pidfile
+        os.pwrite(fileno, data, 0)
+        os.ftruncate(fileno, len(data))
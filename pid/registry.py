@@ -0,0 +1,74 @@
+"""Process wide registry of pidfiles locked by this process.
+
+PidFiles created with process_registry=True share a single kernel lock per
+filename. Threads and code paths in the same process are arbitrated with a
+threading.Lock per entry, the kernel lock is taken by the first acquirer and
+released when the last reference is dropped.
+"""
+import os
+import threading
+try:
+    from threading import get_ident  # NOQA
+except ImportError:
+    # python2 support
+    from thread import get_ident  # NOQA
+
+_mutex = threading.Lock()
+_entries = {}
+
+
+class RegistryEntry(object):
+    __slots__ = ("filename", "lock", "refs", "fh", "owner", "depth", "orphaned")
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.refs = 0
+        # file handle holding the kernel lock, shared by all holders
+        self.fh = None
+        # thread holding the lock and its number of acquisitions, only changed
+        # by the owner
+        self.owner = None
+        self.depth = 0
+        # set in a forked child, the kernel lock belongs to the parent
+        self.orphaned = False
+
+
+def acquire_ref(filename):
+    with _mutex:
+        entry = _entries.get(filename)
+        if entry is None:
+            entry = _entries[filename] = RegistryEntry(filename)
+        entry.refs += 1
+        return entry
+
+
+def release_ref(entry, on_last=None):
+    # on_last runs while holding the registry mutex so a new entry for the same
+    # filename can only be created once the kernel lock has been released
+    with _mutex:
+        entry.refs -= 1
+        if entry.refs > 0:
+            return False
+        if _entries.get(entry.filename) is entry:
+            del _entries[entry.filename]
+        if on_last is not None:
+            on_last()
+        return True
+
+
+def entries():
+    with _mutex:
+        return dict(_entries)
+
+
+def _reset_after_fork():
+    global _mutex, _entries
+    _mutex = threading.Lock()
+    for entry in _entries.values():
+        entry.orphaned = True
+    _entries = {}
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,164 @@
+import os
+import sys
+import errno
+from .base import (
+    get_default_pid_dir,
+    PID_CHECK_EMPTY,
+    PID_CHECK_NOFILE,
+    PID_CHECK_SAMEPID,
+    PID_CHECK_RUNNING,
+    PID_CHECK_NOTRUNNING,
+    PID_CHECK_UNREADABLE,
+    PID_CHECK_LEASE_EXPIRED,
+)
+from .utils import (
+    lease_expired,
+    live_pids,
+    parse_pidfile,
+    process_matches,
+)
+
+
+def _read_pidfile(filename):
+    fd = os.open(filename, os.O_RDONLY)
+    try:
+        data = os.read(fd, 256)
+    finally:
+        os.close(fd)
+
+    return parse_pidfile(data.decode("latin-1"))
+
+
+def _pid_exists(pid):
+    if sys.platform == "win32":
+        # os.kill() terminates the process on windows
+        import psutil
+        return psutil.pid_exists(pid)
+
+    try:
+        os.kill(pid, 0)
+    except OSError as exc:
+        if exc.errno == errno.ESRCH:
+            return False
+    return True
+
+
+def _entry(filename, running, mypid):
+    try:
+        pid, metadata = _read_pidfile(filename)
+    except (IOError, OSError) as exc:
+        if exc.errno in (errno.ENOENT, errno.EISDIR):
+            # removed while scanning or not a pidfile at all
+            return None
+        return filename, None, PID_CHECK_UNREADABLE
+    except ValueError:
+        return filename, None, PID_CHECK_UNREADABLE
+
+    if pid is None:
+        status = PID_CHECK_EMPTY
+    elif pid == mypid:
+        status = PID_CHECK_SAMEPID
+    elif (pid in running) if running is not None else _pid_exists(pid):
+        if not process_matches(pid, metadata):
+            status = PID_CHECK_NOTRUNNING
+        elif lease_expired(metadata):
+            status = PID_CHECK_LEASE_EXPIRED
+        else:
+            status = PID_CHECK_RUNNING
+    else:
+        status = PID_CHECK_NOTRUNNING
+    return filename, pid, status
+
+
+def scan_entries(piddir=None, pattern="*.pid"):
+    """Yield (filename, pid, status) for every pidfile in piddir.
+
+    The running processes are determined once from a single snapshot of the
+    process table instead of signalling every pid separately.
+    """
+    import fnmatch
+
+    if piddir is None:
+        piddir = get_default_pid_dir()
+
+    names = [name for name in os.listdir(piddir) if fnmatch.fnmatch(name, pattern)]
+    running = live_pids() if names else None
+    mypid = os.getpid()
+
+    for name in sorted(names):
+        entry = _entry(os.path.abspath(os.path.join(piddir, name)), running, mypid)
+        if entry is not None:
+            yield entry
+
+
+def scan_file(filename):
+    """Return (filename, pid, status) for a single pidfile.
+
+    status is PID_CHECK_NOFILE when the pidfile does not exist.
+    """
+    filename = os.path.abspath(filename)
+    entry = _entry(filename, None, os.getpid())
+    if entry is None:
+        return filename, None, PID_CHECK_NOFILE
+    return entry
+
+
+def scan(piddir=None, pattern="*.pid"):
+    """Return a dict mapping every pidfile in piddir to its PID_CHECK_* status.
+
+    Unlike PidFile.check() this never raises for running or unreadable
+    pidfiles, they are reported as PID_CHECK_RUNNING and PID_CHECK_UNREADABLE.
+    """
+    return dict((filename, status) for filename, _, status in scan_entries(piddir, pattern))
+
+
+def remove_stale(piddir=None, pattern="*.pid", dry_run=False, lock_backend="flock"):
+    """Remove the pidfiles in piddir whose process is no longer running.
+
+    Returns the list of removed filenames. A pidfile is only removed while
+    holding its lock, after checking again that it is still stale, so a
+    process taking over a stale pidfile at the same time is never affected.
+    Empty pidfiles are left alone as they are being written. POSIX only.
+    """
+    removed = []
+    for filename, _, status in scan_entries(piddir, pattern):
+        if status != PID_CHECK_NOTRUNNING:
+            continue
+        if dry_run:
+            removed.append(filename)
+        elif _remove_if_stale(filename, lock_backend):
+            removed.append(filename)
+    return removed
+
+
+def _remove_if_stale(filename, lock_backend):
+    import fcntl
+    from .posix import ofd_lock
+
+    try:
+        fd = os.open(filename, os.O_RDONLY)
+    except OSError:
+        return False
+    try:
+        try:
+            if lock_backend == "ofd":
+                # a read lock is enough to conflict with the holder and allowed on a read only descriptor
+                ofd_lock(fd, exclusive=False)
+            else:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (IOError, OSError):
+            return False
+        try:
+            current = os.stat(filename)
+        except OSError:
+            return False
+        opened = os.fstat(fd)
+        if (current.st_dev, current.st_ino) != (opened.st_dev, opened.st_ino):
+            return False
+        entry = _entry(filename, None, os.getpid())
+        if entry is None or entry[2] != PID_CHECK_NOTRUNNING:
+            return False
+        os.remove(filename)
+        return True
+    finally:
+        os.close(fd)
@@ -0,0 +1,172 @@
+import os
+import time
+import errno
+from .base import (
+    WAIT_POLL_INTERVAL,
+    PidFileConfigurationError,
+)
+from .posix import (
+    FdPidFile,
+    ofd_lock,
+    ofd_unlock,
+)
+from .utils import (
+    live_pids,
+    monotonic,
+    parse_pidfile,
+)
+
+# every slot is a fixed width record holding the pid padded with spaces and a newline
+SLOT_RECORD_SIZE = 16
+FREE_RECORD = b" " * (SLOT_RECORD_SIZE - 1) + b"\n"
+
+
+def _parse_record(record):
+    record = record.strip(b" \0\n")
+    if not record:
+        return None
+    try:
+        return int(record)
+    except ValueError:
+        return None
+
+
+class SlotPidFile(FdPidFile):
+    """Claim one of `slots` fixed width records in a single pidfile.
+
+    Every record is guarded by its own byte range lock (see ofd_lock) and
+    holds the pid of the process that claimed it. The first record doubles as
+    the classic first line of a pidfile. status() returns the pid of every
+    slot from a single read. Linux only.
+    """
+
+    __slots__ = ("slots", "slot")
+
+    def __init__(self, pidname=None, slots=1, **kwargs):
+        kwargs["lock_backend"] = "ofd"
+        super(SlotPidFile, self).__init__(pidname, **kwargs)
+        if not self.lock_pidfile:
+            raise PidFileConfigurationError("SlotPidFile claims its slot by locking, lock_pidfile cannot be disabled")
+        if self.lease or self.status_block:
+            raise PidFileConfigurationError("lease and status_block are not supported by SlotPidFile")
+        if self.record_start_time:
+            # a record only has room for the pid
+            raise PidFileConfigurationError("record_start_time is not supported by SlotPidFile")
+        if self.process_registry:
+            # the registry shares one lock per filename, every holder needs a slot of its own
+            raise PidFileConfigurationError("process_registry and reentrant are not supported by SlotPidFile")
+        self.slots = slots
+        self.slot = None
+
+    def _read_records(self, fileno):
+        data = os.pread(fileno, self.slots * SLOT_RECORD_SIZE, 0)
+        return [
+            _parse_record(data[offset:offset + SLOT_RECORD_SIZE])
+            for offset in range(0, self.slots * SLOT_RECORD_SIZE, SLOT_RECORD_SIZE)
+        ]
+
+    def _initialize(self, fileno):
+        # the byte after the last record serves as mutex while filling in free
+        # records, nobody writes past the end of the file before that is done
+        size = self.slots * SLOT_RECORD_SIZE
+        ofd_lock(fileno, size, 1, blocking=True)
+        try:
+            current = os.fstat(fileno).st_size
+            if current < size:
+                os.pwrite(fileno, (FREE_RECORD * self.slots)[current:], current)
+        finally:
+            ofd_unlock(fileno, size, 1)
+
+    def _claim(self, fileno):
+        if os.fstat(fileno).st_size < self.slots * SLOT_RECORD_SIZE:
+            self._initialize(fileno)
+
+        records = self._read_records(fileno)
+        # free records first, records with a pid are most likely still locked
+        candidates = [slot for slot, pid in enumerate(records) if pid is None]
+        candidates += [slot for slot, pid in enumerate(records) if pid is not None]
+        for slot in candidates:
+            try:
+                ofd_lock(fileno, slot * SLOT_RECORD_SIZE, SLOT_RECORD_SIZE)
+            except IOError:
+                continue
+            self.slot = slot
+            return
+        raise IOError(errno.EAGAIN, "All %d slots of %s are in use" % (self.slots, self.filename))
+
+    def _flock(self, fileno, blocking=False):
+        # a blocking wait cannot wait for any of several ranges at once, poll instead
+        while True:
+            try:
+                return self._claim(fileno)
+            except IOError:
+                if not blocking:
+                    raise
+            time.sleep(WAIT_POLL_INTERVAL)
+
+    def _lock(self, blocking=False, timeout=None):
+        start = monotonic()
+        try:
+            while True:
+                try:
+                    self._claim(self.fh.fileno())
+                except IOError:
+                    if not blocking or (timeout is not None and monotonic() - start >= timeout):
+                        raise
+                    time.sleep(WAIT_POLL_INTERVAL)
+                    continue
+
+                if not self._is_unlinked(self.fh.fileno()):
+                    return
+                self.fh.close()
+                self.fh = self._open()
+        finally:
+            self.lock_wait_time = monotonic() - start
+
+    def _adopt_file(self, fd):
+        raise PidFileConfigurationError("handover is not supported by SlotPidFile")
+
+    def _read_pidfile(self, fh):
+        slot = 0 if self.slot is None else self.slot
+        return parse_pidfile(os.pread(fh.fileno(), SLOT_RECORD_SIZE, slot * SLOT_RECORD_SIZE).decode("latin-1"))
+
+    def _write_contents(self, contents):
+        record = ("%d" % self.pid).ljust(SLOT_RECORD_SIZE - 1).encode("ascii") + b"\n"
+        os.pwrite(self.fh.fileno(), record, self.slot * SLOT_RECORD_SIZE)
+
+    def _remove(self):
+        # free the record instead of removing the pidfile shared with the other slots
+        if self.slot is not None and self.fh is not None and not self.fh.closed:
+            os.pwrite(self.fh.fileno(), FREE_RECORD, self.slot * SLOT_RECORD_SIZE)
+        self._need_cleanup = False
+
+    def _close(self, fh, cleanup):
+        try:
+            super(SlotPidFile, self)._close(fh, cleanup)
+        finally:
+            if fh is None or fh is self.fh:
+                self.slot = None
+
+    def status(self):
+        """Return the pid in every slot, None for free slots.
+
+        The record of a process which exited without closing its pidfile stays
+        until the slot is claimed again, such slots are reported as free too.
+        """
+        self.setup()
+
+        try:
+            fd = os.open(self.filename, os.O_RDONLY)
+        except OSError as exc:
+            if exc.errno != errno.ENOENT:
+                raise
+            return [None] * self.slots
+        try:
+            records = self._read_records(fd)
+        finally:
+            os.close(fd)
+
+        running = live_pids()
+        if running is None:
+            return records
+        return [pid if pid in running else None for pid in records]
@@ -0,0 +1,122 @@
+"""Fixed layout binary status block for monitoring pidfiles.
+
+PidFiles created with status_block=True pad the text part of the pidfile to
+STATUS_OFFSET bytes and append a block with the layout of STATUS_FORMAT::
+
+  offset  size  field
+       0     4  magic b"PIDS"
+       4     4  version
+       8     4  state flags, see STATE_*
+      12     4  reserved
+      16     8  pid
+      24     8  process start time in clock ticks since boot, 0 if unknown
+      32     8  heartbeat, seconds since the epoch as a double
+
+All fields are native byte order. Readers of the first line of the pidfile
+are not affected. StatusReader maps the block once and reads it without
+syscalls after that.
+"""
+import os
+import struct
+from collections import namedtuple
+
+STATUS_MAGIC = b"PIDS"
+STATUS_VERSION = 1
+STATUS_FORMAT = "=4sIIIqqd"
+STATUS_SIZE = struct.calcsize(STATUS_FORMAT)
+# past the 256 bytes read by pidfile readers
+STATUS_OFFSET = 256
+STATE_OFFSET = STATUS_OFFSET + 8
+HEARTBEAT_OFFSET = STATUS_OFFSET + 32
+
+STATE_RUNNING = 0x1
+# set right before the pidfile is removed, a reader maps the pidfile again
+STATE_CLOSED = 0x2
+# states from here on are free for the application, see PidFile.set_state()
+STATE_USER = 0x100
+
+Status = namedtuple("Status", ["version", "state", "pid", "start_time", "heartbeat"])
+
+
+def pack_status(pid, start_time, heartbeat, state=STATE_RUNNING):
+    return struct.pack(STATUS_FORMAT, STATUS_MAGIC, STATUS_VERSION, state, 0, pid, start_time or 0, heartbeat)
+
+
+def pack_state(state):
+    return struct.pack("=I", state)
+
+
+def pack_heartbeat(heartbeat):
+    return struct.pack("=d", heartbeat)
+
+
+def unpack_status(data, offset=0):
+    magic, version, state, _, pid, start_time, heartbeat = struct.unpack_from(STATUS_FORMAT, data, offset)
+    if magic != STATUS_MAGIC:
+        return None
+    return Status(version, state, pid, start_time, heartbeat)
+
+
+class StatusReader(object):
+    """Read the status block of a pidfile through a read only memory mapping.
+
+    read() returns a Status or None when the pidfile does not exist or has no
+    status block. The pidfile is mapped on first use and mapped again once
+    its holder marked it closed, so a reader can poll a pidfile which is
+    recreated by a new process.
+    """
+
+    __slots__ = ("filename", "_map")
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._map = None
+
+    def _open_map(self):
+        import mmap
+
+        try:
+            fd = os.open(self.filename, os.O_RDONLY)
+        except OSError:
+            return None
+        try:
+            return mmap.mmap(fd, STATUS_OFFSET + STATUS_SIZE, access=mmap.ACCESS_READ)
+        except (ValueError, EnvironmentError):
+            # shorter than a status block
+            return None
+        finally:
+            # the mapping stays valid without the descriptor
+            os.close(fd)
+
+    def read(self):
+        for _ in range(2):
+            if self._map is None:
+                self._map = self._open_map()
+                if self._map is None:
+                    return None
+
+            status = self._read_stable()
+            if status is not None and not status.state & STATE_CLOSED:
+                return status
+            self.close()
+        return status
+
+    def _read_stable(self):
+        # fields are updated in place, read until two reads agree
+        status = unpack_status(self._map, STATUS_OFFSET)
+        while True:
+            again = unpack_status(self._map, STATUS_OFFSET)
+            if again == status:
+                return status
+            status = again
+
+    def close(self):
+        mapping, self._map = self._map, None
+        if mapping is not None:
+            mapping.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type=None, exc_value=None, exc_tb=None):
+        self.close()
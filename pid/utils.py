@@ -1,6 +1,9 @@
 import os
 import sys
-import tempfile
+import time
+import errno
+
+monotonic = getattr(time, "monotonic", time.time)
 
 
 def effective_access(*args, **kwargs):
@@ -33,4 +36,209 @@ def determine_pid_directory():
         if effective_access(os.path.realpath(path), os.W_OK | os.X_OK):
             return path
 
+    import tempfile
     return tempfile.gettempdir()
+
+
+def live_pids():
+    """Return a set with the pids of all running processes.
+
+    Returns None when no cheap process table snapshot is available on this
+    platform, callers should then fall back to checking pids one by one.
+    """
+    if sys.platform == "win32":
+        import psutil
+        return set(psutil.pids())
+
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return None
+
+    return set(int(entry) for entry in entries if entry.isdigit())
+
+
+def process_start_time(pid):
+    """Return the start time of a process in clock ticks since boot, or None."""
+    try:
+        with open("/proc/%d/stat" % pid, "rb") as fh:
+            data = fh.read()
+    except (IOError, OSError):
+        return None
+
+    # the command name can contain spaces and parentheses, skip past it and
+    # continue with the third field (state), the start time is field 22
+    try:
+        return int(data[data.rindex(b")") + 2:].split()[19])
+    except (ValueError, IndexError):
+        return None
+
+
+_boot_id = []
+
+
+def boot_id():
+    """Return the id of the current boot, or None when it is not available."""
+    if not _boot_id:
+        try:
+            with open("/proc/sys/kernel/random/boot_id", "r") as fh:
+                _boot_id.append(fh.read().strip() or None)
+        except (IOError, OSError):
+            _boot_id.append(None)
+    return _boot_id[0]
+
+
+def parse_pidfile(data):
+    """Return (pid, metadata) from the contents of a pidfile.
+
+    The first line holds the pid, the optional second line holds `key=value`
+    pairs. pid is None for an empty pidfile, ValueError is raised when the
+    first line is not a number.
+    """
+    lines = data.split("\n", 2)
+    pid_str = lines[0].strip()
+    if not pid_str:
+        return None, {}
+
+    pid = int(pid_str)
+    metadata = {}
+    if len(lines) > 1:
+        for item in lines[1].split():
+            key, sep, value = item.partition("=")
+            if sep:
+                metadata[key] = value
+    return pid, metadata
+
+
+def process_matches(pid, metadata):
+    """Check a running pid against the process recorded in the pidfile metadata.
+
+    Returns False when the pid was recorded during another boot or now belongs
+    to a process with a different start time, in other words was recycled.
+    """
+    recorded_boot_id = metadata.get("boot_id")
+    if recorded_boot_id and boot_id() not in (None, recorded_boot_id):
+        return False
+
+    try:
+        recorded_start_time = int(metadata.get("start_time", ""))
+    except ValueError:
+        return True
+    start_time = process_start_time(pid)
+    return start_time is None or start_time == recorded_start_time
+
+
+# fixed width so the heartbeat can be updated in place
+HEARTBEAT_FORMAT = "%017.6f"
+
+
+def lease_expired(metadata, now=None):
+    """Check whether the lease recorded in the pidfile metadata has expired.
+
+    Returns False for pidfiles without a lease.
+    """
+    try:
+        heartbeat = float(metadata["heartbeat"])
+        lease = float(metadata["lease"])
+    except (KeyError, ValueError):
+        return False
+    if now is None:
+        now = time.time()
+    return now > heartbeat + lease
+
+
+class LockWaiter(object):
+    """Wait for a lock by repeating non-blocking attempts.
+
+    Nothing blocks in the kernel, so a caller giving up waiting leaves nothing
+    behind which could still take the lock later. On Linux an
+    attempt follows as soon as the pidfile is closed or removed by some
+    process (inotify), otherwise and in between the waiter backs off up to
+    poll_interval seconds.
+    """
+
+    # the close which wakes the waiter happens right before the lock is released
+    MIN_INTERVAL = 0.001
+
+    def __init__(self, lock_func, fileno, filename, poll_interval):
+        self._lock_func = lock_func
+        self._fileno = fileno
+        self.poll_interval = poll_interval
+        self.interval = self.MIN_INTERVAL
+        self._fd = None
+        self._wd = None
+
+        from .watch import add_lock_watch, inotify_available
+        if inotify_available():
+            try:
+                self._fd, self._wd = add_lock_watch(filename)
+            except OSError:
+                # polling works as well, only slower
+                pass
+
+    def fileno(self):
+        """The inotify file descriptor, None when polling."""
+        return self._fd
+
+    def try_lock(self):
+        try:
+            self._lock_func(self._fileno)
+        except (IOError, OSError) as exc:
+            if exc.errno not in (errno.EAGAIN, errno.EACCES, errno.EWOULDBLOCK):
+                raise
+            return False
+        return True
+
+    def woken(self):
+        """Discard pending inotify events, returns whether there were any."""
+        try:
+            return bool(os.read(self._fd, 4096))
+        except OSError as exc:
+            if exc.errno != errno.EAGAIN:
+                raise
+            return False
+
+    def next_interval(self, woken):
+        if woken:
+            self.interval = self.MIN_INTERVAL
+        else:
+            self.interval = min(self.interval * 2, self.poll_interval)
+        return self.interval
+
+    def wait(self, timeout=None):
+        """Return True once the lock is taken, False after timeout seconds."""
+        deadline = None if timeout is None else monotonic() + timeout
+        poller = None
+        if self._fd is not None:
+            import select
+
+            poller = select.poll()
+            poller.register(self._fd, select.POLLIN)
+
+        woken = False
+        while not self.try_lock():
+            interval = self.next_interval(woken)
+            if deadline is not None:
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    return False
+                interval = min(interval, remaining)
+            if poller is None:
+                time.sleep(interval)
+            else:
+                poller.poll(int(interval * 1000) + 1)
+                woken = self.woken()
+        return True
+
+    def close(self):
+        from .watch import remove_lock_watch
+
+        fd, self._fd = self._fd, None
+        if fd is not None:
+            remove_lock_watch(fd, self._wd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type=None, exc_value=None, exc_tb=None):
+        self.close()
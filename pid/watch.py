@@ -0,0 +1,377 @@
+"""Watch a pidfile or a pid directory for changes.
+
+Watcher reports "created", "written" and "deleted" events. A PidFile removes
+its pidfile when it is released, so "deleted" also means released. On Linux
+the events come from inotify, elsewhere the directory is polled. See
+pid.aio.AsyncWatcher for asyncio applications.
+"""
+import os
+import sys
+import time
+import errno
+import struct
+import fnmatch
+import threading
+from collections import namedtuple
+from .base import WAIT_POLL_INTERVAL
+from .utils import monotonic
+
+CREATED = "created"
+WRITTEN = "written"
+DELETED = "deleted"
+
+WatchEvent = namedtuple("WatchEvent", ["kind", "filename"])
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_CLOSE_NOWRITE = 0x00000010
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+# a holder closes and usually removes its pidfile when releasing the lock
+LOCK_WAIT_MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_CLOSE_NOWRITE | IN_DELETE_SELF
+_EVENT_HEADER = struct.Struct("iIII")
+
+_libc = []
+
+
+def _inotify_libc():
+    if not _libc:
+        libc = None
+        if sys.platform.startswith("linux"):
+            import ctypes
+            try:
+                libc = ctypes.CDLL(None, use_errno=True)
+                libc.inotify_init1
+                libc.inotify_add_watch
+                libc.inotify_rm_watch
+            except (OSError, AttributeError):
+                libc = None
+        _libc.append(libc)
+    return _libc[0]
+
+
+def inotify_available():
+    return _inotify_libc() is not None
+
+
+def _inotify_init():
+    import ctypes
+
+    libc = _inotify_libc()
+    if libc is None:
+        raise OSError(errno.ENOSYS, "inotify is not available")
+    fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    if fd < 0:
+        error = ctypes.get_errno()
+        raise OSError(error, os.strerror(error))
+    return fd
+
+
+def _inotify_add_watch(fd, path, mask):
+    import ctypes
+
+    wd = _inotify_libc().inotify_add_watch(fd, path.encode(sys.getfilesystemencoding()), mask)
+    if wd < 0:
+        error = ctypes.get_errno()
+        raise OSError(error, "%s: %s" % (os.strerror(error), path))
+    return wd
+
+
+def inotify_watch(path, mask):
+    """Return a non-blocking inotify descriptor watching path for the events in mask."""
+    fd = _inotify_init()
+    try:
+        _inotify_add_watch(fd, path, mask)
+    except OSError:
+        os.close(fd)
+        raise
+    return fd
+
+
+# all lock waiters of a process share one inotify instance, closing an
+# instance waits for the kernel to synchronize which takes milliseconds
+_lock_watch_mutex = threading.Lock()
+# pid of the owning process and descriptor
+_lock_watch_fd = [None, None]
+# read end to write end of the wake up pipe of every waiter, per watch descriptor
+_lock_watch_waiters = {}
+
+
+def _nonblocking_pipe():
+    import fcntl
+
+    fds = os.pipe()
+    for fd in fds:
+        fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+        fcntl.fcntl(fd, fcntl.F_SETFD, fcntl.fcntl(fd, fcntl.F_GETFD) | fcntl.FD_CLOEXEC)
+    return fds
+
+
+def _dispatch_lock_events(fd):
+    import select
+
+    poller = select.poll()
+    poller.register(fd, select.POLLIN)
+    while True:
+        poller.poll()
+        try:
+            data = os.read(fd, 65536)
+        except OSError as exc:
+            if exc.errno == errno.EAGAIN:
+                continue
+            raise
+
+        wds = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size + length
+            wds.add(wd)
+        with _lock_watch_mutex:
+            if -1 in wds:
+                # events were lost, wake everybody
+                wds = set(_lock_watch_waiters)
+            for wd in wds:
+                for wakeup in _lock_watch_waiters.get(wd, {}).values():
+                    try:
+                        os.write(wakeup, b"\0")
+                    except OSError as exc:
+                        # a full pipe already wakes the waiter
+                        if exc.errno != errno.EAGAIN:
+                            raise
+
+
+def add_lock_watch(path):
+    """Watch path for LOCK_WAIT_MASK events, returns (fd, wd) for remove_lock_watch().
+
+    fd is the read end of a pipe of its own. A thread reads the events of the
+    shared inotify instance and writes to the pipes of all waiters of the file,
+    so every waiter is woken by a release.
+    """
+    with _lock_watch_mutex:
+        pid = os.getpid()
+        if _lock_watch_fd[0] != pid:
+            if _lock_watch_fd[1] is not None:
+                # inherited through fork, the watches and the waiters belong to the parent
+                os.close(_lock_watch_fd[1])
+                _lock_watch_fd[1] = None
+                for waiters in _lock_watch_waiters.values():
+                    for wakeup in waiters.values():
+                        os.close(wakeup)
+            _lock_watch_waiters.clear()
+            _lock_watch_fd[1] = _inotify_init()
+            _lock_watch_fd[0] = pid
+            thread = threading.Thread(target=_dispatch_lock_events, args=(_lock_watch_fd[1],), name="pid-lock-watch")
+            thread.daemon = True
+            thread.start()
+        # watching the same file again returns the same watch descriptor
+        wd = _inotify_add_watch(_lock_watch_fd[1], path, LOCK_WAIT_MASK)
+        fd, wakeup = _nonblocking_pipe()
+        _lock_watch_waiters.setdefault(wd, {})[fd] = wakeup
+        return fd, wd
+
+
+def remove_lock_watch(fd, wd):
+    with _lock_watch_mutex:
+        if _lock_watch_fd[0] == os.getpid():
+            waiters = _lock_watch_waiters.get(wd, {})
+            wakeup = waiters.pop(fd, None)
+            if wakeup is not None:
+                os.close(wakeup)
+            if not waiters:
+                _lock_watch_waiters.pop(wd, None)
+                # fails when the watch already went away with the file, nothing to do then
+                _inotify_libc().inotify_rm_watch(_lock_watch_fd[1], wd)
+    os.close(fd)
+
+
+def _kind(mask):
+    if mask & (IN_CREATE | IN_MOVED_TO):
+        return CREATED
+    if mask & (IN_DELETE | IN_MOVED_FROM):
+        return DELETED
+    if mask & IN_MODIFY:
+        return WRITTEN
+    return None
+
+
+class Watcher(object):
+    """Report changes to a pidfile or to the pidfiles matching pattern in a directory.
+
+    read() returns the events which happened since the previous call, waiting
+    up to timeout seconds for at least one. Iterating over a watcher yields
+    events as they happen. Without inotify (use_inotify=False or not on
+    Linux) the directory is polled every poll_interval seconds.
+    """
+
+    def __init__(self, path, pattern="*.pid", poll_interval=WAIT_POLL_INTERVAL, use_inotify=None):
+        path = os.path.abspath(path)
+        if os.path.isdir(path):
+            self.directory = path
+            self.name = None
+        else:
+            self.directory, self.name = os.path.split(path)
+        self.pattern = pattern
+        self.poll_interval = poll_interval
+        self._pending = []
+        self._fd = None
+        self._snapshot = None
+
+        if use_inotify is None:
+            use_inotify = inotify_available()
+        if use_inotify:
+            self._fd = inotify_watch(self.directory, WATCH_MASK)
+        else:
+            self._snapshot = self._scan()
+
+    def _matches(self, name):
+        if self.name is not None:
+            return name == self.name
+        return fnmatch.fnmatch(name, self.pattern)
+
+    def fileno(self):
+        """The inotify file descriptor, None when polling."""
+        return self._fd
+
+    def _read_inotify(self):
+        try:
+            data = os.read(self._fd, 65536)
+        except OSError as exc:
+            if exc.errno == errno.EAGAIN:
+                return []
+            raise
+
+        events = []
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0").decode(sys.getfilesystemencoding())
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                # events were lost, report what is there as written
+                events.extend(
+                    WatchEvent(WRITTEN, os.path.join(self.directory, name))
+                    for name in sorted(self._scan())
+                )
+                continue
+            kind = _kind(mask)
+            if kind is None or not self._matches(name):
+                continue
+            event = WatchEvent(kind, os.path.join(self.directory, name))
+            # a write usually arrives as several modifications
+            if not events or events[-1] != event:
+                events.append(event)
+        return events
+
+    def _scan(self):
+        snapshot = {}
+        try:
+            names = os.listdir(self.directory)
+        except OSError as exc:
+            if exc.errno != errno.ENOENT:
+                raise
+            return snapshot
+        for name in names:
+            if not self._matches(name):
+                continue
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            snapshot[name] = (st.st_ino, st.st_mtime, st.st_size)
+        return snapshot
+
+    def _diff(self):
+        snapshot = self._scan()
+        previous, self._snapshot = self._snapshot, snapshot
+        events = []
+        for name in sorted(set(previous) | set(snapshot)):
+            before, after = previous.get(name), snapshot.get(name)
+            filename = os.path.join(self.directory, name)
+            if before == after:
+                continue
+            if after is None:
+                events.append(WatchEvent(DELETED, filename))
+            elif before is None:
+                events.append(WatchEvent(CREATED, filename))
+            elif before[0] != after[0]:
+                # replaced between two polls
+                events.append(WatchEvent(DELETED, filename))
+                events.append(WatchEvent(CREATED, filename))
+            else:
+                events.append(WatchEvent(WRITTEN, filename))
+        return events
+
+    def read(self, timeout=None):
+        """Return the next events, or an empty list after timeout seconds."""
+        if self._pending:
+            events, self._pending = self._pending, []
+            return events
+
+        deadline = None if timeout is None else monotonic() + timeout
+        if self._fd is None:
+            while True:
+                events = self._diff()
+                if events:
+                    return events
+                if deadline is None:
+                    remaining = self.poll_interval
+                else:
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        return events
+                time.sleep(min(self.poll_interval, remaining))
+
+        import select
+
+        poller = select.poll()
+        poller.register(self._fd, select.POLLIN)
+        while True:
+            events = self._read_inotify()
+            if events:
+                return events
+            if deadline is None:
+                poller.poll()
+                continue
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                return events
+            poller.poll(int(remaining * 1000) + 1)
+
+    def wait_for(self, kinds=(CREATED, WRITTEN, DELETED), timeout=None):
+        """Return the first event of one of kinds, or None after timeout seconds."""
+        deadline = None if timeout is None else monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0, deadline - monotonic())
+            events = self.read(remaining)
+            for index, event in enumerate(events):
+                if event.kind in kinds:
+                    self._pending = events[index + 1:] + self._pending
+                    return event
+            if deadline is not None and monotonic() >= deadline:
+                return None
+
+    def __iter__(self):
+        while True:
+            for event in self.read():
+                yield event
+
+    def close(self):
+        fd, self._fd = self._fd, None
+        if fd is not None:
+            os.close(fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type=None, exc_value=None, exc_tb=None):
+        self.close()
@@ -7,6 +7,7 @@ from .base import (
     PidFileAlreadyRunningError,
     PidFileConfigurationError,
 )
+from .utils import process_matches
 
 
 class PidFile(PidFileBase):
@@ -15,6 +16,21 @@ class PidFile(PidFileBase):
         if self.allow_samepid:
             raise PidFileConfigurationError("Flag allow_samepid is not supported on non-POSIX systems")
 
+        if self.lock_backend != "flock":
+            raise PidFileConfigurationError("lock_backend is not supported on non-POSIX systems")
+
+        if self.prefork:
+            raise PidFileConfigurationError("prefork is not supported on non-POSIX systems")
+
+        if self.lease:
+            raise PidFileConfigurationError("lease is not supported on non-POSIX systems")
+
+        if self.status_block:
+            raise PidFileConfigurationError("status_block is not supported on non-POSIX systems")
+
+        if self.forward_handler is not None:
+            raise PidFileConfigurationError("forward_handler is not supported on non-POSIX systems")
+
         if self.chmod and self.chmod != DEFAULT_CHMOD:
             raise PidFileConfigurationError("chmod is not supported on non-POSIX systems")
 
@@ -36,14 +52,30 @@ class PidFile(PidFileBase):
     def _pid_exists(self, pid):
         return psutil.pid_exists(pid)
 
-    def _flock(self, fileno):
+    def _wait_pid(self, pid, metadata, timeout):
+        if not process_matches(pid, metadata):
+            return True
+        try:
+            psutil.Process(pid).wait(timeout)
+        except psutil.NoSuchProcess:
+            pass
+        except psutil.TimeoutExpired:
+            return False
+        return True
+
+    def create(self, blocking=False, timeout=None):
+        if blocking or timeout is not None:
+            raise PidFileConfigurationError("Waiting for the lock is not supported on non-POSIX systems")
+        return super(PidFile, self).create()
+
+    def _flock(self, fileno, blocking=False):
         msvcrt.locking(self.fh.fileno(), msvcrt.LK_NBLCK, 1)
         # Try to read from file to check if it is actually locked
         self.fh.seek(0)
         self.fh.read(1)
 
-    def _chmod(self):
+    def _chmod(self, fileno):
         pass
 
-    def _chown(self):
+    def _chown(self, fileno):
         pass
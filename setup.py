@@ -53,6 +53,11 @@ setup(
     ],
     keywords='pid pidfile context manager decorator',
     packages=["pid"],
+    entry_points={
+        'console_scripts': [
+            'pid = pid.cli:main',
+        ],
+    },
     install_requires=[
         'psutil>=5.4.8 ; sys_platform == "win32"',
     ],
@@ -0,0 +1,259 @@
+import os
+import sys
+import signal
+import asyncio
+import tempfile
+import pytest
+
+import pid
+from pid.aio import AsyncPidFile
+
+pid.DEFAULT_PID_DIR = tempfile.gettempdir()
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="does not run on windows")
+
+
+def run(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def test_async_pid_context_manager():
+    async def main():
+        async with AsyncPidFile(piddir=pid.DEFAULT_PID_DIR) as pidfile:
+            pidnr = int(open(pidfile.filename, "r").readline().strip())
+            assert pidnr == os.getpid()
+        return pidfile
+
+    pidfile = run(main())
+    assert not os.path.exists(pidfile.filename)
+
+
+def test_async_pid_already_locked():
+    async def main():
+        async with AsyncPidFile("testasyncpid", piddir=pid.DEFAULT_PID_DIR) as _pid:
+            with pytest.raises(pid.PidFileAlreadyLockedError):
+                async with AsyncPidFile("testasyncpid", piddir=pid.DEFAULT_PID_DIR):
+                    pass
+            assert os.path.exists(_pid.filename)
+        return _pid
+
+    _pid = run(main())
+    assert not os.path.exists(_pid.filename)
+
+
+def test_async_pid_blocking_does_not_block_loop():
+    async def main():
+        holder = AsyncPidFile("testasyncpid", piddir=pid.DEFAULT_PID_DIR)
+        await holder.acquire()
+        ticks = []
+
+        async def ticker():
+            while True:
+                ticks.append(None)
+                await asyncio.sleep(0.01)
+
+        async def release_later():
+            await asyncio.sleep(0.2)
+            await holder.release()
+
+        ticker_task = asyncio.ensure_future(ticker())
+        asyncio.ensure_future(release_later())
+        pidfile = AsyncPidFile("testasyncpid", piddir=pid.DEFAULT_PID_DIR)
+        await pidfile.acquire(blocking=True, timeout=10)
+        try:
+            assert pidfile.lock_wait_time > 0.1
+            assert len(ticks) > 5
+        finally:
+            ticker_task.cancel()
+            await pidfile.release()
+        return pidfile
+
+    pidfile = run(main())
+    assert not os.path.exists(pidfile.filename)
+
+
+def test_async_pid_timeout_and_cancel():
+    async def main():
+        async with AsyncPidFile("testasyncpid", piddir=pid.DEFAULT_PID_DIR) as _pid:
+            pidfile = AsyncPidFile("testasyncpid", piddir=pid.DEFAULT_PID_DIR)
+            with pytest.raises(pid.PidFileAlreadyLockedError):
+                await pidfile.acquire(timeout=0.05)
+
+            task = asyncio.ensure_future(pidfile.acquire(blocking=True))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            assert pidfile.fh.closed
+            assert os.path.exists(_pid.filename)
+        return _pid
+
+    _pid = run(main())
+    assert not os.path.exists(_pid.filename)
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="requires /proc")
+def test_async_pid_cancel_leaves_nothing_behind():
+    async def main():
+        async with AsyncPidFile("testasyncpid", piddir=pid.DEFAULT_PID_DIR) as _pid:
+            # the first wait opens the inotify instance shared by all waits
+            with pytest.raises(pid.PidFileAlreadyLockedError):
+                await AsyncPidFile("testasyncpid", piddir=pid.DEFAULT_PID_DIR).acquire(timeout=0.01)
+            fds = len(os.listdir("/proc/self/fd"))
+            for _ in range(10):
+                task = asyncio.ensure_future(AsyncPidFile("testasyncpid", piddir=pid.DEFAULT_PID_DIR).acquire(blocking=True))
+                await asyncio.sleep(0.01)
+                task.cancel()
+                with pytest.raises(asyncio.CancelledError):
+                    await task
+            assert len(os.listdir("/proc/self/fd")) == fds
+        return _pid
+
+    _pid = run(main())
+    assert not os.path.exists(_pid.filename)
+    # nobody is left waiting who could take the lock now
+    with pid.PidFile("testasyncpid", piddir=pid.DEFAULT_PID_DIR):
+        pass
+
+
+def test_async_pid_lease():
+    import time
+
+    with pytest.raises(pid.PidFileConfigurationError):
+        AsyncPidFile("testasyncpid", process_registry=True)
+
+    async def main():
+        hung = pid.PidFile("testasyncpid", piddir=pid.DEFAULT_PID_DIR, lease=0.1)
+        hung.create()
+        try:
+            await asyncio.sleep(0.2)
+            pidfile = AsyncPidFile("testasyncpid", piddir=pid.DEFAULT_PID_DIR, lease=0.2, heartbeat_interval=0.02)
+            async with pidfile:
+                assert hung.heartbeat() is False
+                stop, thread = pidfile._heartbeat
+                assert thread.is_alive()
+                await asyncio.sleep(0.3)
+                assert time.time() - float(pid.utils.parse_pidfile(open(pidfile.filename).read())[1]["heartbeat"]) < 0.2
+            assert not thread.is_alive()
+        finally:
+            hung.close()
+        return pidfile
+
+    pidfile = run(main())
+    assert not os.path.exists(pidfile.filename)
+
+
+def test_async_pid_lease_cancel_take_over():
+    import time
+    from unittest.mock import patch
+
+    take_over = AsyncPidFile._take_over
+
+    def slow_take_over(self, fh):
+        time.sleep(0.1)
+        return take_over(self, fh)
+
+    async def main():
+        hung = pid.PidFile("testasyncpid", piddir=pid.DEFAULT_PID_DIR, lease=0.1)
+        hung.create()
+        try:
+            await asyncio.sleep(0.2)
+            fds = len(os.listdir("/proc/self/fd"))
+            with patch.object(AsyncPidFile, "_take_over", slow_take_over):
+                pidfile = AsyncPidFile("testasyncpid", piddir=pid.DEFAULT_PID_DIR, lease=10)
+                task = asyncio.ensure_future(pidfile.acquire())
+                await asyncio.sleep(0.02)
+                task.cancel()
+                with pytest.raises(asyncio.CancelledError):
+                    await task
+                # the takeover completes in the executor, its pidfile is closed
+                await asyncio.sleep(0.2)
+            assert pidfile.fh is None or pidfile.fh.closed
+            assert len(os.listdir("/proc/self/fd")) == fds
+            with pid.PidFile("testasyncpid", piddir=pid.DEFAULT_PID_DIR, lease=10):
+                pass
+        finally:
+            hung.close()
+
+    run(main())
+
+
+def test_async_pid_term_signal():
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    async def main():
+        async with AsyncPidFile(piddir=pid.DEFAULT_PID_DIR) as pidfile:
+            assert pidfile._signal_loop is not None
+            # the process wide handler is left to the event loop
+            assert signal.getsignal(signal.SIGTERM) is not signal.SIG_DFL
+        assert pidfile._signal_loop is None
+        return pidfile
+
+    pidfile = run(main())
+    assert signal.getsignal(signal.SIGTERM) == signal.SIG_DFL
+    assert not os.path.exists(pidfile.filename)
+
+
+def test_async_pid_term_signal_shutdown():
+    def previous(signum, frame):
+        pass
+
+    signal.signal(signal.SIGTERM, previous)
+
+    async def main():
+        pidfile = AsyncPidFile(piddir=pid.DEFAULT_PID_DIR, register_term_signal_handler=True)
+        try:
+            async with pidfile:
+                os.kill(os.getpid(), signal.SIGTERM)
+                await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            assert not os.path.exists(pidfile.filename)
+            return pidfile
+        raise AssertionError("not cancelled by SIGTERM")
+
+    try:
+        pidfile = run(main())
+        assert signal.getsignal(signal.SIGTERM) is previous
+        assert not os.path.exists(pidfile.filename)
+    finally:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+
+@pytest.mark.parametrize("use_inotify", [True, False])
+def test_async_watcher(tmp_path, use_inotify):
+    from pid.aio import AsyncWatcher
+    from pid.watch import inotify_available
+
+    if use_inotify and not inotify_available():
+        pytest.skip("requires inotify")
+
+    piddir = str(tmp_path)
+
+    async def main():
+        watcher = AsyncWatcher(piddir, use_inotify=use_inotify, poll_interval=0.01)
+        try:
+            assert await watcher.read(timeout=0.01) == []
+
+            async def lifecycle():
+                await asyncio.sleep(0.05)
+                async with AsyncPidFile("watched", piddir=piddir, register_atexit=False):
+                    await asyncio.sleep(0.1)
+
+            task = asyncio.ensure_future(lifecycle())
+            kinds = []
+            async for event in watcher:
+                assert event.filename == os.path.join(piddir, "watched.pid")
+                kinds.append(event.kind)
+                if event.kind == "deleted":
+                    break
+            await task
+            assert kinds[0] == "created"
+            assert await watcher.wait_for(timeout=0.05) is None
+        finally:
+            watcher.close()
+
+    run(main())
@@ -531,3 +531,1341 @@ def test_register_atexit_false(mock_atexit_register):
 def test_register_atexit_true(mock_atexit_register):
     with pid.PidFile(register_atexit=True) as pidfile:
         mock_atexit_register.assert_called_once_with(pidfile.close)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="does not run on windows")
+def test_scan():
+    piddir = os.path.join(pid.DEFAULT_PID_DIR, "testscan.dir")
+    if not os.path.isdir(piddir):
+        os.makedirs(piddir)
+    for name in os.listdir(piddir):
+        os.remove(os.path.join(piddir, name))
+
+    with open(os.path.join(piddir, "empty.pid"), "w") as f:
+        f.write("\n")
+    with open(os.path.join(piddir, "notrunning.pid"), "w") as f:
+        # hope this does not clash
+        f.write("999999999\n")
+    with open(os.path.join(piddir, "garbage.pid"), "w") as f:
+        f.write("garbage\n")
+    with open(os.path.join(piddir, "ignored.txt"), "w") as f:
+        f.write("1\n")
+
+    with pid.PidFile("samepid", piddir=piddir):
+        result = pid.scan(piddir)
+
+    def status(name):
+        return result[os.path.join(piddir, name)]
+
+    assert len(result) == 4
+    assert status("empty.pid") == pid.PID_CHECK_EMPTY
+    assert status("notrunning.pid") == pid.PID_CHECK_NOTRUNNING
+    assert status("garbage.pid") == pid.PID_CHECK_UNREADABLE
+    assert status("samepid.pid") == pid.PID_CHECK_SAMEPID
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="does not run on windows")
+def test_scan_running():
+    pidname = "test_scan_running"
+    piddir = pid.DEFAULT_PID_DIR
+    with pid.PidFile(pidname=pidname, piddir=piddir) as _pid:
+        with patch("os.getpid", return_value=-1):
+            result = pid.scan(piddir, pattern=pidname + ".pid")
+        assert result == {_pid.filename: pid.PID_CHECK_RUNNING}
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="does not run on windows")
+def test_pid_create_blocking():
+    import threading
+
+    holder = pid.PidFile("testpidblocking")
+    holder.create()
+    timer = threading.Timer(0.2, holder.close)
+    timer.start()
+    try:
+        pidfile = pid.PidFile("testpidblocking")
+        pidfile.create(blocking=True, timeout=10)
+        try:
+            assert 0.1 < pidfile.lock_wait_time < 10
+            assert int(open(pidfile.filename).readline()) == os.getpid()
+        finally:
+            pidfile.close()
+    finally:
+        timer.join()
+        holder.close()
+    assert not os.path.exists(pidfile.filename)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="does not run on windows")
+def test_pid_create_blocking_timeout():
+    with pid.PidFile("testpidblocking") as _pid:
+        pidfile = pid.PidFile("testpidblocking")
+        with pytest.raises(pid.PidFileAlreadyLockedError):
+            pidfile.create(timeout=0.1)
+        assert pidfile.lock_wait_time >= 0.1
+        assert os.path.exists(_pid.filename)
+    assert not os.path.exists(_pid.filename)
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="requires /proc")
+def test_pid_create_timeout_leaves_nothing_behind():
+    import threading
+
+    holder = pid.PidFile("testpidblocking", register_atexit=False)
+    holder.create()
+    try:
+        # the first wait opens the inotify instance shared by all waits
+        with pytest.raises(pid.PidFileAlreadyLockedError):
+            pid.PidFile("testpidblocking", register_atexit=False).create(timeout=0.01)
+        threads, fds = threading.active_count(), len(os.listdir("/proc/self/fd"))
+        for _ in range(20):
+            with pytest.raises(pid.PidFileAlreadyLockedError):
+                pid.PidFile("testpidblocking", register_atexit=False).create(timeout=0.01)
+        assert threading.active_count() == threads
+        assert len(os.listdir("/proc/self/fd")) == fds
+    finally:
+        holder.close()
+    # nobody is left waiting who could take the lock now
+    with pid.PidFile("testpidblocking"):
+        pass
+
+
+def test_pid_lock_watch_wakes_all_waiters():
+    import select
+    from pid.watch import add_lock_watch, remove_lock_watch, inotify_available
+
+    if not inotify_available():
+        pytest.skip("requires inotify")
+
+    pidfile = pid.PidFile("testpidlockwatch")
+    pidfile.create()
+    try:
+        waiters = [add_lock_watch(pidfile.filename) for _ in range(3)]
+        try:
+            assert len(set(wd for _, wd in waiters)) == 1
+            pidfile.close()
+            for fd, _ in waiters:
+                assert select.select([fd], [], [], 1)[0] == [fd]
+                assert os.read(fd, 4096)
+        finally:
+            for fd, wd in waiters:
+                remove_lock_watch(fd, wd)
+    finally:
+        pidfile.close()
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="does not run on windows")
+def test_pid_pool():
+    from pid.pool import PidPool
+
+    pools = [PidPool("testpidpool", slots=3) for _ in range(3)]
+    try:
+        assert [pool.create() for pool in pools] == [0, 1, 2]
+        assert all(os.path.exists(pool.pidfile.filename) for pool in pools)
+
+        with pytest.raises(pid.PidFileAlreadyLockedError):
+            PidPool("testpidpool", slots=3).create()
+
+        filename = pools[1].pidfile.filename
+        pools[1].close()
+        assert not os.path.exists(filename)
+
+        with PidPool("testpidpool", slots=3) as pool:
+            assert pool.slot == 1
+    finally:
+        for pool in pools:
+            pool.close()
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="does not run on windows")
+def test_pid_pool_single_lock_attempt():
+    from pid.pool import PidPool
+
+    pools = [PidPool("testpidpool", slots=8) for _ in range(7)]
+    try:
+        for pool in pools:
+            pool.create()
+
+        with patch.object(pid.PidFile, "create", autospec=True, side_effect=pid.PidFile.create) as mock_create:
+            with PidPool("testpidpool", slots=8) as pool:
+                assert pool.slot == 7
+            assert mock_create.call_count == 1
+    finally:
+        for pool in pools:
+            pool.close()
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="does not run on windows")
+def test_pid_pool_stale_slot():
+    from pid.pool import PidPool
+
+    with PidPool("testpidpool", slots=2, register_atexit=False) as pool:
+        # simulate a process which died without releasing its slot
+        pool.pidfile.close()
+        pool.pidfile = None
+
+        with PidPool("testpidpool", slots=2) as pool1:
+            assert pool1.slot == 1
+            with PidPool("testpidpool", slots=2) as pool2:
+                assert pool2.slot == 0
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="does not run on windows")
+def test_pid_pool_control_file():
+    import time
+    import fcntl
+    from pid.pool import PidPool
+
+    pool = PidPool("testpidpool", slots=2)
+    pool.create()
+    control_filename = pool.control_filename
+    try:
+        assert os.path.exists(control_filename)
+
+        # a busy control file does not block claiming a slot
+        pool1 = PidPool("testpidpool", slots=2)
+        with open(control_filename, "r+") as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            assert pool1.create() == 1
+            start = time.time()
+            with pytest.raises(pid.PidFileAlreadyLockedError):
+                PidPool("testpidpool", slots=2).create(timeout=0.2)
+            assert time.time() - start >= 0.2
+        pool1.close()
+    finally:
+        pool.close()
+
+    # removed by the last holder
+    assert not os.path.exists(control_filename)
+
+
+def _wait_for_exit_with_child(pidfile):
+    import threading
+    import subprocess
+
+    proc = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(0.3)"])
+    # reap the child as soon as it exits, a zombie still exists for os.kill()
+    reaper = threading.Thread(target=proc.wait)
+    reaper.start()
+    try:
+        pidfile.setup()
+        with open(pidfile.filename, "w") as f:
+            f.write("%d\n" % proc.pid)
+        assert pidfile.wait_for_exit(timeout=0.01) is False
+        assert pidfile.wait_for_exit(timeout=10) is True
+    finally:
+        reaper.join()
+        pidfile.close(cleanup=True)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="does not run on windows")
+def test_pid_wait_for_exit():
+    _wait_for_exit_with_child(pid.PidFile("testpidwait"))
+
+    pidfile = pid.PidFile("testpidwait")
+    assert pidfile.wait_for_exit(timeout=0) is True
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/stat"), reason="requires /proc")
+def test_pid_wait_for_exit_recycled_pid():
+    from pid.cli import main
+    from pid.utils import process_start_time
+
+    pidfile = pid.PidFile("testpidwait")
+    pidfile.setup()
+    # the pid now belongs to a process started at another time
+    with open(pidfile.filename, "w") as f:
+        f.write("%d\nstart_time=%d\n" % (os.getppid(), process_start_time(os.getppid()) + 1))
+    try:
+        assert pidfile.wait_for_exit(timeout=0.3) is True
+        assert pid.PidFile("testpidwait", lock_pidfile=False).check() == pid.PID_CHECK_NOTRUNNING
+        assert main(["wait", "--timeout", "0.3", pidfile.filename]) == 0
+    finally:
+        os.remove(pidfile.filename)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="does not run on windows")
+def test_pid_wait_for_exit_polling():
+    import errno
+
+    pidfile = pid.PidFile("testpidwait")
+    with patch("os.pidfd_open", create=True, side_effect=OSError(errno.ENOSYS, "not implemented")):
+        _wait_for_exit_with_child(pidfile)
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/stat"), reason="requires /proc")
+def test_pid_record_start_time():
+    from pid.utils import boot_id, process_start_time
+
+    with pid.PidFile("testpidstarttime", record_start_time=True) as _pid:
+        with open(_pid.filename, "r") as f:
+            pidnr, metadata = f.readline(), f.readline()
+        assert int(pidnr) == os.getpid()
+        assert metadata.split() == ["start_time=%d" % process_start_time(os.getpid()), "boot_id=%s" % boot_id()]
+
+        with pytest.raises(pid.PidFileAlreadyRunningError):
+            pid.PidFile("testpidstarttime", lock_pidfile=False).check()
+        assert pid.scan(os.path.dirname(_pid.filename), pattern="testpidstarttime.pid") == {_pid.filename: pid.PID_CHECK_SAMEPID}
+    assert not os.path.exists(_pid.filename)
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/stat"), reason="requires /proc")
+def test_pid_check_recycled_pid():
+    from pid.utils import boot_id, process_start_time
+
+    start_time = process_start_time(os.getpid())
+    pidfile = pid.PidFile("testpidstarttime")
+    pidfile.setup()
+    try:
+        for metadata in ("start_time=%d" % (start_time + 1), "start_time=%d boot_id=other" % start_time):
+            with open(pidfile.filename, "w") as f:
+                f.write("%d\n%s\n" % (os.getpid(), metadata))
+            assert pidfile.check() == pid.PID_CHECK_NOTRUNNING
+            with patch("os.getpid", return_value=-1):
+                assert pid.scan(os.path.dirname(pidfile.filename), pattern="testpidstarttime.pid") == {pidfile.filename: pid.PID_CHECK_NOTRUNNING}
+
+        with open(pidfile.filename, "w") as f:
+            f.write("%d\nstart_time=%d boot_id=%s\n" % (os.getpid(), start_time, boot_id()))
+        with pytest.raises(pid.PidFileAlreadyRunningError):
+            pidfile.check()
+    finally:
+        pidfile.close(cleanup=True)
+    assert not os.path.exists(pidfile.filename)
+
+
+@pytest.mark.skipif(sys.version_info < (3, 7), reason="requires python3.7 or higher")
+def test_import_time():
+    import json
+    import subprocess
+
+    s = """
+import sys, time, json
+before = set(sys.modules)
+start = time.perf_counter()
+import pid
+elapsed = time.perf_counter() - start
+imported = sorted(set(sys.modules) - before)
+print(json.dumps({"elapsed": elapsed, "imported": imported, "piddir": "DEFAULT_PID_DIR" in vars(pid.base)}))
+"""
+    result = json.loads(subprocess.check_output([sys.executable, "-c", s]))
+    print("import pid: %.2fms, %d modules" % (result["elapsed"] * 1000, len(result["imported"])))
+
+    assert result["piddir"] is False
+    for module in ("logging", "tempfile", "threading", "signal", "asyncio", "pid.status"):
+        assert module not in result["imported"]
+    # generous upper bound, the module checks above are the precise regression test
+    assert result["elapsed"] < 0.5
+
+
+def test_pid_piddir_validation_cache():
+    import shutil
+    from pid.base import invalidate_piddir_cache
+
+    piddir = os.path.join(pid.DEFAULT_PID_DIR, "testpidcache.dir")
+    invalidate_piddir_cache(piddir)
+    with pid.PidFile(piddir=piddir):
+        pass
+
+    with patch("os.path.isdir") as mock_isdir, patch("pid.base.effective_access") as mock_access:
+        pidfile = pid.PidFile(piddir=piddir)
+        pidfile.setup()
+        mock_isdir.assert_not_called()
+        mock_access.assert_not_called()
+
+    # removing the directory invalidates the cache on the next create
+    shutil.rmtree(piddir)
+    with pidfile:
+        assert os.path.exists(pidfile.filename)
+    assert not os.path.exists(pidfile.filename)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="does not run on windows")
+def test_benchmarks_smoke(tmp_path):
+    import json
+    import subprocess
+
+    output = str(tmp_path / "bench.json")
+    bench = os.path.join(os.path.dirname(__file__), os.pardir, "benchmarks", "bench_pid.py")
+    subprocess.check_call([
+        sys.executable, bench, "--iterations", "5", "--processes", "2",
+        "--contention-iterations", "2", "--output", output,
+    ])
+    with open(output) as f:
+        results = json.load(f)
+    assert sorted(results["benchmarks"]) == ["check", "contention", "create_close", "decorator"]
+    assert results["benchmarks"]["contention"]["acquisition_latency"]["p99"] >= 0
+
+
+def test_pid_metrics_collector():
+    from pid.metrics import MemoryCollector
+
+    collector = MemoryCollector()
+    with pid.PidFile("testpidmetrics", collector=collector) as _pid:
+        with pytest.raises(pid.PidFileAlreadyLockedError):
+            pid.PidFile("testpidmetrics", collector=collector).create()
+        with pytest.raises(pid.PidFileAlreadyRunningError):
+            pid.PidFile("testpidmetrics", lock_pidfile=False, collector=collector).check()
+
+    assert collector.count("setup") == 3
+    assert collector.count("flock", "ok") == 1
+    assert collector.count("flock", "locked") == 1
+    assert collector.count("check", pid.PID_CHECK_RUNNING) == 1
+    assert collector.count("write", pid.PID_CHECK_NOFILE) + collector.count("write", pid.PID_CHECK_EMPTY) == 1
+    assert collector.count("close", "removed") == 1
+    assert collector.histograms["flock"].count == 2
+    assert collector.histograms["flock"].quantile(0.5) > 0
+    assert "flock.locked" in collector.snapshot()["counters"]
+    assert not os.path.exists(_pid.filename)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="does not run on windows")
+def test_pid_metrics_default_collector_stale():
+    from pid.metrics import MemoryCollector, set_default_collector
+
+    collector = MemoryCollector()
+    set_default_collector(collector)
+    try:
+        pidfile = pid.PidFile("testpidmetrics")
+        pidfile.setup()
+        with open(pidfile.filename, "w") as f:
+            # hope this does not clash
+            f.write("999999999\n")
+        with pidfile:
+            pass
+    finally:
+        set_default_collector(None)
+
+    assert collector.count("write", pid.PID_CHECK_NOTRUNNING) == 1
+
+
+@pytest.mark.skipif(sys.platform == "win32" or hasattr(os, "pwrite"), reason="only without os.pwrite")
+def test_pid_requires_pwrite():
+    from pid.posix import FdPidFile
+
+    with pytest.raises(pid.PidFileConfigurationError):
+        FdPidFile("testfdpidfile")
+    with pytest.raises(pid.PidFileConfigurationError):
+        pid.PidFile("testpidlease", lease=10)
+    with pytest.raises(pid.PidFileConfigurationError):
+        pid.PidFile("testpidstatus", status_block=True)
+    with pid.PidFile("testpidhandover") as pidfile:
+        with pytest.raises(pid.PidFileConfigurationError):
+            pidfile.prepare_exec_handover()
+
+
+@pytest.mark.skipif(not hasattr(os, "pwrite"), reason="requires os.pread and os.pwrite")
+@pytest.mark.skipif(sys.platform == "win32", reason="does not run on windows")
+def test_fd_pidfile():
+    from pid.posix import FdPidFile
+
+    with FdPidFile("testfdpidfile", record_start_time=True) as _pid:
+        with open(_pid.filename, "r") as f:
+            assert int(f.readline()) == os.getpid()
+        with pytest.raises(pid.PidFileAlreadyLockedError):
+            FdPidFile("testfdpidfile").create()
+        with pytest.raises(pid.PidFileAlreadyRunningError):
+            FdPidFile("testfdpidfile", lock_pidfile=False).check()
+    assert not os.path.exists(_pid.filename)
+    assert _pid.fh.closed
+    assert FdPidFile("testfdpidfile").check() == pid.PID_CHECK_NOFILE
+
+
+@pytest.mark.skipif(sys.version_info < (3, 4), reason="requires tracemalloc")
+@pytest.mark.skipif(sys.platform == "win32", reason="does not run on windows")
+def test_fd_pidfile_allocations():
+    import tracemalloc
+    from pid.posix import FdPidFile
+
+    def peak(cls):
+        pidfile = cls("testfdpidfile")
+        pidfile.setup()
+        tracemalloc.start()
+        try:
+            pidfile.create()
+            pidfile.close()
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    # the buffered text file stack alone allocates a 8KiB buffer
+    assert peak(FdPidFile) < peak(pid.PidFile) / 2
+
+
+@pytest.mark.skipif(not hasattr(os, "pwrite"), reason="requires os.pread and os.pwrite")
+@pytest.mark.skipif(sys.platform == "win32", reason="does not run on windows")
+def test_fd_pidfile_syscalls(tmp_path):
+    import fcntl
+    import pid.posix
+    try:
+        import _pyio
+    except ImportError:
+        pytest.skip("requires _pyio")
+
+    def count_syscalls(cls, cycles):
+        calls = []
+
+        def counting(module, name):
+            func = getattr(module, name)
+
+            def wrapper(*args, **kwargs):
+                calls.append(name)
+                return func(*args, **kwargs)
+            return patch.object(module, name, wrapper)
+
+        names = [
+            "open", "close", "read", "write", "pread", "pwrite", "lseek", "fstat", "stat", "lstat",
+            "ftruncate", "isatty", "remove", "unlink", "fsync", "getpid", "kill", "access", "dup",
+        ]
+        patches = [counting(os, name) for name in names if hasattr(os, name)]
+        patches += [counting(fcntl, name) for name in ("flock", "fcntl", "lockf")]
+        # the pure python io stack does every syscall through the os module
+        patches.append(patch("pid.base.open", _pyio.open, create=True))
+
+        with pid.posix.FdPidFile("testfdpidfile", piddir=str(tmp_path), register_atexit=False):
+            pass
+        for p in patches:
+            p.start()
+        try:
+            for _ in range(cycles):
+                with getattr(pid.posix, cls)("testfdpidfile", piddir=str(tmp_path), register_atexit=False):
+                    pass
+        finally:
+            for p in reversed(patches):
+                p.stop()
+        return len(calls) / float(cycles)
+
+    fd_syscalls, text_syscalls = count_syscalls("FdPidFile", 10), count_syscalls("PidFile", 10)
+    print("syscalls per create/close cycle: FdPidFile %.1f, PidFile %.1f" % (fd_syscalls, text_syscalls))
+    assert 0 < fd_syscalls < text_syscalls
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="does not run on windows")
+def test_pid_trust_lock():
+    pidfile = pid.PidFile("testpidtrustlock")
+    pidfile.setup()
+    # a stale pidfile left behind by a crashed process whose pid got recycled
+    with open(pidfile.filename, "w") as f:
+        f.write("%d\n" % os.getppid())
+
+    with patch("os.kill") as mock_kill:
+        with pidfile:
+            assert int(open(pidfile.filename).readline()) == os.getpid()
+        mock_kill.assert_not_called()
+    assert not os.path.exists(pidfile.filename)
+
+    with open(pidfile.filename, "w") as f:
+        f.write("%d\n" % os.getppid())
+    try:
+        with pytest.raises(pid.PidFileAlreadyRunningError):
+            pid.PidFile("testpidtrustlock", trust_lock=False).create()
+    finally:
+        os.remove(pidfile.filename)
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="requires linux")
+def test_pid_ofd_lock_backend():
+    import threading
+
+    with pid.PidFile("testpidofd", lock_backend="ofd") as _pid:
+        errors = []
+
+        def compete():
+            try:
+                pid.PidFile("testpidofd", lock_backend="ofd").create()
+            except pid.PidFileAlreadyLockedError as exc:
+                errors.append(exc)
+
+        thread = threading.Thread(target=compete)
+        thread.start()
+        thread.join()
+        assert len(errors) == 1
+
+        pidfile = pid.PidFile("testpidofd", lock_backend="ofd")
+        timer = threading.Timer(0.1, _pid.close)
+        timer.start()
+        try:
+            pidfile.create(timeout=10)
+            assert int(open(pidfile.filename).readline()) == os.getpid()
+        finally:
+            timer.join()
+            pidfile.close()
+    assert not os.path.exists(_pid.filename)
+
+    with pytest.raises(pid.PidFileConfigurationError):
+        pid.PidFile(lock_backend="unknown")
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="requires linux")
+def test_ofd_byte_range_lock(tmp_path):
+    from pid.posix import ofd_lock, ofd_unlock
+
+    filename = str(tmp_path / "ranges")
+    fd1 = os.open(filename, os.O_RDWR | os.O_CREAT)
+    fd2 = os.open(filename, os.O_RDWR)
+    try:
+        ofd_lock(fd1, 0, 1)
+        ofd_lock(fd2, 1, 1)
+        with pytest.raises(IOError):
+            ofd_lock(fd2, 0, 1)
+        ofd_unlock(fd1, 0, 1)
+        ofd_lock(fd2, 0, 1)
+    finally:
+        os.close(fd1)
+        os.close(fd2)
+
+
+@pytest.mark.skipif(not hasattr(os, "pwrite"), reason="requires os.pread and os.pwrite")
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="requires linux")
+def test_slot_pidfile():
+    from pid.slots import SlotPidFile, SLOT_RECORD_SIZE
+
+    pidfiles = [SlotPidFile("testslotpidfile", slots=3) for _ in range(3)]
+    try:
+        for pidfile in pidfiles:
+            pidfile.create()
+        assert [pidfile.slot for pidfile in pidfiles] == [0, 1, 2]
+        assert os.path.getsize(pidfiles[0].filename) == 3 * SLOT_RECORD_SIZE
+        assert pidfiles[0].status() == [os.getpid()] * 3
+        # the first record is readable as a classic pidfile
+        assert int(open(pidfiles[0].filename).readline()) == os.getpid()
+
+        with pytest.raises(pid.PidFileAlreadyLockedError):
+            SlotPidFile("testslotpidfile", slots=3).create()
+
+        pidfiles[1].close()
+        assert pidfiles[0].status() == [os.getpid(), None, os.getpid()]
+
+        with SlotPidFile("testslotpidfile", slots=3) as pidfile:
+            assert pidfile.slot == 1
+    finally:
+        for pidfile in pidfiles:
+            pidfile.close()
+
+    assert SlotPidFile("testslotpidfile", slots=3).status() == [None] * 3
+
+
+@pytest.mark.skipif(not hasattr(os, "pwrite"), reason="requires os.pread and os.pwrite")
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="requires linux")
+def test_slot_pidfile_crashed_holder():
+    import subprocess
+    from pid.slots import SlotPidFile, SLOT_RECORD_SIZE
+
+    for option in ("lock_pidfile", "record_start_time", "process_registry", "reentrant"):
+        with pytest.raises(pid.PidFileConfigurationError):
+            SlotPidFile("testslotpidfile", slots=2, **{option: option != "lock_pidfile"})
+
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    with SlotPidFile("testslotpidfilecrash", slots=2) as pidfile:
+        # a holder which exited without freeing its record
+        record = ("%d" % process.pid).ljust(SLOT_RECORD_SIZE - 1).encode("ascii") + b"\n"
+        os.pwrite(pidfile.fh.fileno(), record, SLOT_RECORD_SIZE)
+        try:
+            assert pidfile.status() == [os.getpid(), None]
+        finally:
+            os.remove(pidfile.filename)
+
+
+@pytest.mark.skipif(not hasattr(os, "pwrite"), reason="requires os.pread and os.pwrite")
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="requires linux")
+def test_slot_pidfile_blocking():
+    import threading
+    from pid.slots import SlotPidFile
+
+    with SlotPidFile("testslotpidfile", slots=1) as holder:
+        with pytest.raises(pid.PidFileAlreadyLockedError):
+            SlotPidFile("testslotpidfile", slots=1).create(timeout=0.1)
+
+        timer = threading.Timer(0.1, holder.close)
+        timer.start()
+        pidfile = SlotPidFile("testslotpidfile", slots=1)
+        try:
+            pidfile.create(timeout=10)
+            assert pidfile.slot == 0
+        finally:
+            timer.join()
+            pidfile.close()
+
+
+@pytest.mark.skipif(sys.version_info < (3, 2), reason="requires Lock.acquire with timeout")
+def test_pid_process_registry():
+    import threading
+    from pid import registry
+    from pid.metrics import MemoryCollector
+
+    collector = MemoryCollector()
+    holder = pid.PidFile("testpidregistry", process_registry=True, collector=collector)
+    holder.create()
+    filename = holder.filename
+    assert registry.entries()[filename].refs == 1
+
+    with pytest.raises(pid.PidFileAlreadyLockedError):
+        pid.PidFile("testpidregistry", process_registry=True, collector=collector).create()
+    with pytest.raises(pid.PidFileAlreadyLockedError):
+        pid.PidFile("testpidregistry", process_registry=True, collector=collector).create(timeout=0.05)
+
+    timer = threading.Timer(0.1, holder.close)
+    timer.start()
+    waiter = pid.PidFile("testpidregistry", process_registry=True, collector=collector)
+    try:
+        waiter.create(timeout=10)
+        timer.join()
+        # the lock was handed over in memory, the pidfile stays in place
+        assert os.path.exists(filename)
+        assert holder.fh is None
+        assert waiter.fh is not None and not waiter.fh.closed
+    finally:
+        timer.join()
+        waiter.close()
+
+    assert collector.count("flock", "ok") == 1
+    assert collector.count("flock", "registry") == 1
+    assert collector.count("flock", "locked") == 0
+    assert not os.path.exists(filename)
+    assert filename not in registry.entries()
+
+    # a new acquirer takes the kernel lock again
+    with pid.PidFile("testpidregistry", process_registry=True, collector=collector):
+        assert collector.count("flock", "ok") == 2
+
+
+@pytest.mark.skipif(not hasattr(os, "register_at_fork"), reason="requires os.register_at_fork")
+def test_pid_process_registry_fork():
+    from pid import registry
+
+    with pid.PidFile("testpidregistry", process_registry=True) as holder:
+        child = os.fork()
+        if child == 0:
+            code = 1
+            try:
+                if not registry.entries():
+                    # the inherited holder must not remove the pidfile of the parent
+                    holder.close()
+                    code = 0 if os.path.exists(holder.filename) else 2
+            finally:
+                os._exit(code)
+        _, status = os.waitpid(child, 0)
+        assert os.WEXITSTATUS(status) == 0
+        assert os.path.exists(holder.filename)
+        assert registry.entries()[holder.filename].refs == 1
+    assert not os.path.exists(holder.filename)
+
+
+@pytest.mark.skipif(not hasattr(os, "register_at_fork"), reason="requires os.register_at_fork")
+def test_pid_fork_child_drops_pidfile():
+    with pid.PidFile("testpidfork") as holder:
+        child = os.fork()
+        if child == 0:
+            code = 1
+            try:
+                if holder.fh is None and holder.pid == os.getpid():
+                    # what the atexit hook of the child does
+                    holder.close()
+                    code = 0 if os.path.exists(holder.filename) else 2
+            finally:
+                os._exit(code)
+        _, status = os.waitpid(child, 0)
+        assert os.WEXITSTATUS(status) == 0
+        assert os.path.exists(holder.filename)
+        assert int(open(holder.filename).readline()) == os.getpid()
+        with pytest.raises(pid.PidFileAlreadyLockedError):
+            pid.PidFile("testpidfork").create()
+    assert not os.path.exists(holder.filename)
+
+
+@pytest.mark.skipif(not hasattr(os, "register_at_fork"), reason="requires os.register_at_fork")
+def test_pid_prefork():
+    read_fd, write_fd = os.pipe()
+    with pid.PidFile("testpidprefork", prefork=True, register_atexit=False) as master:
+        assert master.worker_pidfile is None
+        child = os.fork()
+        if child == 0:
+            code = 1
+            try:
+                os.close(read_fd)
+                worker = master.worker_pidfile
+                if worker is not None and int(open(worker.filename).readline()) == os.getpid():
+                    os.write(write_fd, worker.filename.encode())
+                    os.close(write_fd)
+                    worker.close()
+                    code = 0
+            finally:
+                os._exit(code)
+        os.close(write_fd)
+        worker_filename = os.read(read_fd, 4096).decode()
+        os.close(read_fd)
+        _, status = os.waitpid(child, 0)
+        assert os.WEXITSTATUS(status) == 0
+        assert os.path.basename(worker_filename) == "testpidprefork-%d.pid" % child
+        assert os.path.dirname(worker_filename) == os.path.dirname(master.filename)
+        assert not os.path.exists(worker_filename)
+        assert int(open(master.filename).readline()) == os.getpid()
+    assert not os.path.exists(master.filename)
+
+
+@patch("atexit.register", autospec=True)
+def test_pid_decorator_reuse(mock_atexit_register):
+    from pid.decorator import pidfile
+
+    calls = []
+
+    @pidfile("testpiddecorator", reuse=True)
+    def test_decorator():
+        assert os.path.exists(test_decorator.pidfile.filename)
+        calls.append(1)
+
+    for _ in range(5):
+        test_decorator()
+    assert len(calls) == 5
+    # one PidFile per decorated function, registered with atexit once
+    mock_atexit_register.assert_called_once_with(test_decorator.pidfile.close)
+    assert not os.path.exists(test_decorator.pidfile.filename)
+
+
+def test_pid_decorator_hold():
+    from pid.decorator import pidfile
+
+    @pidfile("testpiddecorator", hold=True)
+    def test_decorator():
+        pass
+
+    test_decorator()
+    fh = test_decorator.pidfile.fh
+    test_decorator()
+    # the pidfile stays locked between calls
+    assert test_decorator.pidfile.fh is fh
+    with pytest.raises(pid.PidFileAlreadyLockedError):
+        pid.PidFile("testpiddecorator").create()
+    test_decorator.pidfile.close()
+    assert not os.path.exists(test_decorator.pidfile.filename)
+
+
+def test_pid_decorator_reentrant():
+    from pid.decorator import pidfile
+
+    @pidfile("testpiddecorator", reentrant=True)
+    def recurse(depth):
+        assert os.path.exists(recurse.pidfile.filename)
+        if depth:
+            recurse(depth - 1)
+
+    recurse(3)
+    assert not os.path.exists(recurse.pidfile.filename)
+    assert recurse.pidfile.reentrant
+
+    import threading
+
+    errors = []
+
+    @pidfile("testpiddecorator", reentrant=True, hold=True)
+    def held(depth):
+        if depth:
+            held(depth - 1)
+
+    def other_thread():
+        try:
+            held(0)
+        except pid.PidFileAlreadyLockedError as exc:
+            errors.append(exc)
+
+    held(2)
+    held(1)
+    # still held by this thread after the outermost call returned
+    assert held.pidfile._depth == 1
+    thread = threading.Thread(target=other_thread)
+    thread.start()
+    thread.join()
+    assert len(errors) == 1
+    held.pidfile.close()
+    assert not os.path.exists(held.pidfile.filename)
+
+    @pidfile("testpiddecorator", reuse=True)
+    def not_reentrant(depth):
+        if depth:
+            not_reentrant(depth - 1)
+
+    with pytest.raises(pid.PidFileAlreadyLockedError):
+        not_reentrant(1)
+    assert not os.path.exists(not_reentrant.pidfile.filename)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="does not run on windows")
+def test_pid_reentrant():
+    from pid.metrics import MemoryCollector
+
+    collector = MemoryCollector()
+    pidfile = pid.PidFile("testpidreentrant", reentrant=True, collector=collector)
+    with pidfile:
+        with patch("os.kill") as mock_kill:
+            with pidfile:
+                with pidfile:
+                    assert os.path.exists(pidfile.filename)
+            # nested acquisitions neither check the pid nor touch the pidfile
+            mock_kill.assert_not_called()
+        assert os.path.exists(pidfile.filename)
+        assert collector.count("close") == 0
+    assert not os.path.exists(pidfile.filename)
+    assert collector.count("flock") == 1
+    assert collector.count("close", "removed") == 1
+
+
+@pytest.mark.skipif(sys.version_info < (3, 2), reason="requires python3.2 or higher")
+def test_pid_reentrant_contextdecorator():
+    import threading
+
+    @pid.PidFile("testpidreentrant", reentrant=True)
+    def outer():
+        inner()
+        return os.path.exists(os.path.join(os.path.dirname(pidfile.filename), "testpidreentrant.pid"))
+
+    @pid.PidFile("testpidreentrant", reentrant=True)
+    def inner():
+        errors = []
+
+        def other_thread():
+            try:
+                pid.PidFile("testpidreentrant", reentrant=True).create()
+            except pid.PidFileAlreadyLockedError as exc:
+                errors.append(exc)
+
+        thread = threading.Thread(target=other_thread)
+        thread.start()
+        thread.join()
+        # nesting is limited to the thread holding the pidfile
+        assert len(errors) == 1
+
+    pidfile = pid.PidFile("testpidreentrant")
+    pidfile.setup()
+    assert outer() is True
+    assert not os.path.exists(pidfile.filename)
+
+    with pytest.raises(pid.PidFileAlreadyLockedError):
+        with pid.PidFile("testpidreentrant", reentrant=True):
+            with pid.PidFile("testpidreentrant"):
+                pass
+    assert not os.path.exists(pidfile.filename)
+
+
+@pytest.mark.skipif(not hasattr(os, "pwrite"), reason="requires os.pwrite")
+@pytest.mark.skipif(sys.platform == "win32", reason="does not run on windows")
+def test_pid_lease_heartbeat():
+    from pid.utils import parse_pidfile
+
+    with pid.PidFile("testpidlease", lease=10) as pidfile:
+        with open(pidfile.filename) as f:
+            contents = f.read()
+        _, metadata = parse_pidfile(contents)
+        assert float(metadata["lease"]) == 10
+
+        assert pidfile.heartbeat() is True
+        with open(pidfile.filename) as f:
+            updated = f.read()
+        # updated in place, only the heartbeat changed
+        assert len(updated) == len(contents)
+        assert float(parse_pidfile(updated)[1]["heartbeat"]) >= float(metadata["heartbeat"])
+        assert updated.replace(parse_pidfile(updated)[1]["heartbeat"], "") == contents.replace(metadata["heartbeat"], "")
+
+        with pytest.raises(pid.PidFileAlreadyRunningError):
+            pid.PidFile("testpidlease", lock_pidfile=False).check()
+    assert pidfile.heartbeat() is False
+
+
+@pytest.mark.skipif(not hasattr(os, "pwrite"), reason="requires os.pwrite")
+@pytest.mark.skipif(sys.platform == "win32", reason="does not run on windows")
+def test_pid_lease_expired_take_over():
+    import time
+
+    hung = pid.PidFile("testpidlease", lease=0.1)
+    hung.create()
+    try:
+        time.sleep(0.2)
+        assert pid.PidFile("testpidlease", lock_pidfile=False).check() == pid.PID_CHECK_LEASE_EXPIRED
+        # without a lease of its own a new instance does not take over
+        with pytest.raises(pid.PidFileAlreadyLockedError):
+            pid.PidFile("testpidlease").create()
+
+        with pid.PidFile("testpidlease", lease=10) as pidfile:
+            assert not os.path.exists(pidfile.filename + ".takeover")
+            assert hung.heartbeat() is False
+            hung.close()
+            # the hung instance leaves the pidfile of its successor alone
+            assert os.path.exists(pidfile.filename)
+            with pytest.raises(pid.PidFileAlreadyRunningError):
+                pid.PidFile("testpidlease", lock_pidfile=False).check()
+        assert not os.path.exists(pidfile.filename)
+    finally:
+        hung.close()
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="does not run on windows")
+def test_scan_lease_expired():
+    pidfile = pid.PidFile("testpidlease")
+    pidfile.setup()
+    with open(pidfile.filename, "w") as f:
+        f.write("%d\nheartbeat=%017.6f lease=1\n" % (os.getppid(), 1.0))
+    try:
+        assert pid.scan(os.path.dirname(pidfile.filename), "testpidlease.pid") == {pidfile.filename: pid.PID_CHECK_LEASE_EXPIRED}
+    finally:
+        os.remove(pidfile.filename)
+
+
+def test_scan_file_win32_does_not_signal():
+    import types
+    from pid import scanner
+
+    pidfile = pid.PidFile("testpidscanwin32")
+    pidfile.setup()
+    with open(pidfile.filename, "w") as f:
+        f.write("%d\n" % os.getppid())
+    psutil = types.ModuleType("psutil")
+    psutil.pid_exists = lambda pid: True
+    try:
+        with patch.object(scanner.sys, "platform", "win32"), \
+                patch.dict(sys.modules, {"psutil": psutil}), \
+                patch("os.kill") as kill:
+            assert scanner.scan_file(pidfile.filename)[2] == pid.PID_CHECK_RUNNING
+        assert not kill.called
+    finally:
+        os.remove(pidfile.filename)
+
+
+@pytest.mark.skipif(not hasattr(os, "pwrite"), reason="requires os.pwrite")
+@pytest.mark.skipif(sys.platform == "win32", reason="does not run on windows")
+def test_pid_lease_heartbeat_thread():
+    import time
+
+    with pytest.raises(pid.PidFileConfigurationError):
+        pid.PidFile("testpidlease", heartbeat_interval=1)
+
+    with pid.PidFile("testpidlease", lease=0.2, heartbeat_interval=0.02) as pidfile:
+        time.sleep(0.4)
+        with pytest.raises(pid.PidFileAlreadyRunningError):
+            pid.PidFile("testpidlease", lock_pidfile=False).check()
+        stop, thread = pidfile._heartbeat
+        assert thread.is_alive()
+    assert not thread.is_alive()
+    assert pidfile._heartbeat is None
+
+
+@pytest.mark.skipif(not hasattr(os, "pwrite"), reason="requires os.pwrite")
+@pytest.mark.skipif(sys.platform == "win32", reason="does not run on windows")
+@pytest.mark.parametrize("pidfile_class", ["PidFile", "FdPidFile"])
+def test_pid_status_block(pidfile_class):
+    import pid.posix
+    from pid.status import StatusReader, STATE_RUNNING, STATE_USER, STATUS_VERSION
+
+    pidfile = getattr(pid.posix, pidfile_class)("testpidstatus", status_block=True, record_start_time=True)
+    pidfile.setup()
+    reader = StatusReader(pidfile.filename)
+    assert reader.read() is None
+    with pidfile:
+        status = reader.read()
+        assert status.version == STATUS_VERSION
+        assert status.pid == os.getpid()
+        assert status.state == STATE_RUNNING
+        with open("/proc/self/stat", "rb") as f:
+            assert status.start_time == int(f.read().rsplit(b")", 1)[1].split()[19])
+
+        # the text part is unchanged for existing readers
+        with pytest.raises(pid.PidFileAlreadyRunningError):
+            pid.PidFile("testpidstatus", lock_pidfile=False).check()
+        assert pid.scan(os.path.dirname(pidfile.filename), "testpidstatus.pid") == {pidfile.filename: pid.PID_CHECK_SAMEPID}
+
+        assert pidfile.heartbeat() is True
+        assert pidfile.set_state(STATE_RUNNING | STATE_USER) is True
+        # served from the same mapping
+        mapping = reader._map
+        updated = reader.read()
+        assert reader._map is mapping
+        assert updated.heartbeat >= status.heartbeat
+        assert updated.state == STATE_RUNNING | STATE_USER
+
+    assert reader.read() is None
+
+    # a recreated pidfile is mapped again
+    with pidfile:
+        assert reader.read().pid == os.getpid()
+    reader.close()
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="does not run on windows")
+def test_cli_status_and_gc(tmp_path, capsys):
+    import json
+    from pid.cli import main
+
+    piddir = str(tmp_path)
+    with open(os.path.join(piddir, "stale.pid"), "w") as f:
+        # hope this does not clash
+        f.write("999999999\n")
+    with pid.PidFile("running", piddir=piddir):
+        assert main(["status", "--json", piddir]) == 1
+        statuses = dict((os.path.basename(entry["filename"]), entry["status"]) for entry in json.loads(capsys.readouterr().out))
+        assert statuses == {"running.pid": pid.PID_CHECK_SAMEPID, "stale.pid": pid.PID_CHECK_NOTRUNNING}
+
+        assert main(["status", os.path.join(piddir, "running.pid")]) == 0
+        assert capsys.readouterr().out.split()[:2] == ["samepid", str(os.getpid())]
+        assert main(["status", os.path.join(piddir, "missing.pid")]) == 1
+        assert capsys.readouterr().out.split()[0] == "nofile"
+
+        assert main(["gc", "--dry-run", piddir]) == 0
+        assert capsys.readouterr().out.split() == [os.path.join(piddir, "stale.pid")]
+        assert os.path.exists(os.path.join(piddir, "stale.pid"))
+        assert main(["gc", piddir]) == 0
+        assert not os.path.exists(os.path.join(piddir, "stale.pid"))
+        assert os.path.exists(os.path.join(piddir, "running.pid"))
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="does not run on windows")
+def test_cli_acquire_and_wait(tmp_path):
+    import subprocess
+    from pid.cli import main
+
+    filename = str(tmp_path / "cli.pid")
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(pid.__file__))))
+    script = "import sys; sys.exit(int(open(sys.argv[1]).readline()) and 3)"
+    command = [sys.executable, "-m", "pid", "acquire", filename, "--", sys.executable, "-c", script, filename]
+    assert subprocess.call(command, env=env) == 3
+    assert not os.path.exists(filename)
+
+    with pid.PidFile("cli", piddir=str(tmp_path)):
+        assert subprocess.call(command, env=env) == 1
+        assert main(["wait", "--timeout", "0.1", filename]) == 1
+    assert main(["wait", "--timeout", "0.1", filename]) == 0
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="does not run on windows")
+def test_cli_acquire_arguments(tmp_path, capsys):
+    from pid.cli import main
+
+    filename = str(tmp_path / "cli.pid")
+    assert main(["acquire", filename, "--", str(tmp_path / "missing")]) == 127
+    assert "cannot run" in capsys.readouterr().err
+    with open(str(tmp_path / "noexec"), "w") as f:
+        f.write("#!/bin/sh\n")
+    assert main(["acquire", filename, "--", str(tmp_path / "noexec")]) == 126
+    assert not os.path.exists(filename)
+
+    script = "import sys; sys.exit(int(sys.argv[1] == '--wait') + 4)"
+    # options after the pidfile are ours, after -- they belong to the command
+    assert main(["acquire", filename, "--wait", "--timeout", "1", "--", sys.executable, "-c", script, "--wait"]) == 5
+    assert main(["acquire", filename, "--wait", sys.executable, os.devnull]) == 0
+    assert not os.path.exists(filename)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="does not run on windows")
+@pytest.mark.parametrize("use_inotify", [True, False])
+def test_watcher(tmp_path, use_inotify):
+    import threading
+    import time
+    from pid.watch import Watcher, inotify_available, CREATED, WRITTEN, DELETED
+
+    if use_inotify and not inotify_available():
+        pytest.skip("requires inotify")
+
+    piddir = str(tmp_path)
+    filename = os.path.join(piddir, "watched.pid")
+
+    def lifecycle():
+        time.sleep(0.05)
+        pidfile = pid.PidFile("watched", piddir=piddir, register_atexit=False, register_term_signal_handler=False)
+        pidfile.create()
+        time.sleep(0.1)
+        pidfile.close()
+
+    with Watcher(filename, use_inotify=use_inotify, poll_interval=0.01) as watcher:
+        assert (watcher.fileno() is not None) == use_inotify
+        assert watcher.read(timeout=0.01) == []
+        thread = threading.Thread(target=lifecycle)
+        thread.start()
+        try:
+            assert watcher.wait_for((CREATED, WRITTEN), timeout=5).filename == filename
+            assert watcher.wait_for((DELETED,), timeout=5).filename == filename
+        finally:
+            thread.join()
+
+    with Watcher(piddir, pattern="*.pid", use_inotify=use_inotify, poll_interval=0.01) as watcher:
+        with open(os.path.join(piddir, "other.txt"), "w") as f:
+            f.write("ignored")
+        with open(os.path.join(piddir, "other.pid"), "w") as f:
+            f.write("1\n")
+        events = watcher.read(timeout=5)
+        assert events[0] == (CREATED, os.path.join(piddir, "other.pid"))
+        assert all(event.filename.endswith(".pid") for event in events)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="does not run on windows")
+def test_leader_election_failover(tmp_path):
+    import time
+    import signal
+    import threading
+    import subprocess
+    from pid.leader import LeaderElection
+
+    piddir = str(tmp_path)
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(pid.__file__))))
+    script = """
+import sys, time
+from pid.leader import LeaderElection
+election = LeaderElection("leader", piddir=sys.argv[1])
+election.run()
+sys.stdout.write("elected\\n")
+sys.stdout.flush()
+time.sleep(60)
+"""
+    leader = subprocess.Popen([sys.executable, "-c", script, piddir], env=env, stdout=subprocess.PIPE)
+    try:
+        assert leader.stdout.readline() == b"elected\n"
+
+        elected = threading.Event()
+        standby = LeaderElection("leader", piddir=piddir, on_elected=lambda election: elected.set(), register_atexit=False)
+        assert standby.leader_pid() == leader.pid
+        assert standby.run(timeout=0.05) is False
+        standby.start()
+        assert not elected.wait(0.1)
+        assert not standby.is_leader
+
+        killed = time.time()
+        os.kill(leader.pid, signal.SIGKILL)
+        assert elected.wait(10)
+        failover = time.time() - killed
+        print("leader failover: %.2fms" % (failover * 1000))
+        # the lock is handed over by the kernel, no retry interval involved
+        assert failover < 1
+
+        assert standby.is_leader
+        assert standby.leader_pid() == os.getpid()
+        standby.resign()
+        assert not os.path.exists(standby.pidfile.filename)
+    finally:
+        if leader.poll() is None:
+            leader.kill()
+        leader.wait()
+        leader.stdout.close()
+
+
+@pytest.mark.skipif(sys.version_info < (3, 4), reason="requires socket.sendmsg and os.set_inheritable")
+@pytest.mark.skipif(sys.platform == "win32", reason="does not run on windows")
+@pytest.mark.parametrize("pidfile_class", ["PidFile", "FdPidFile"])
+def test_pid_handover_socket(pidfile_class):
+    import socket
+    import pid.posix
+
+    cls = getattr(pid.posix, pidfile_class)
+    old = cls("testpidhandover", register_atexit=False)
+    old.create()
+    new = cls("testpidhandover", register_atexit=False)
+    sender, receiver = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        old.send_handover(sender)
+        new.receive_handover(receiver)
+        assert old.fh.closed
+        # what the atexit hook of the old process does
+        old.close()
+        assert os.path.exists(new.filename)
+        assert int(open(new.filename).readline()) == os.getpid()
+        with pytest.raises(pid.PidFileAlreadyLockedError):
+            cls("testpidhandover", register_atexit=False).create()
+    finally:
+        sender.close()
+        receiver.close()
+        new.close()
+    assert not os.path.exists(new.filename)
+
+
+@pytest.mark.skipif(sys.version_info < (3, 4), reason="requires os.set_inheritable")
+@pytest.mark.skipif(sys.platform == "win32", reason="does not run on windows")
+def test_pid_handover_exec(tmp_path):
+    import subprocess
+
+    piddir = str(tmp_path)
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(pid.__file__))))
+    successor = """
+import sys, pid
+pidfile = pid.PidFile("handover", piddir=sys.argv[1])
+pidfile.adopt()
+sys.stdout.write("adopted\\n")
+sys.stdout.flush()
+sys.stdin.read()
+"""
+    predecessor = """
+import os, sys, pid
+pidfile = pid.PidFile("handover", piddir=sys.argv[1])
+pidfile.create()
+env = dict(os.environ)
+env.update(pidfile.prepare_exec_handover())
+os.execve(sys.executable, [sys.executable, "-c", sys.argv[2], sys.argv[1]], env)
+"""
+    process = subprocess.Popen(
+        [sys.executable, "-c", predecessor, piddir, successor], env=env,
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+    )
+    filename = os.path.join(piddir, "handover.pid")
+    try:
+        assert process.stdout.readline() == b"adopted\n"
+        assert int(open(filename).readline()) == process.pid
+        with pytest.raises(pid.PidFileAlreadyLockedError):
+            pid.PidFile("handover", piddir=piddir, register_atexit=False).create()
+    finally:
+        process.stdin.close()
+        process.wait()
+        process.stdout.close()
+    assert process.returncode == 0
+    assert not os.path.exists(filename)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="does not run on windows")
+def test_pid_forward(tmp_path):
+    import time
+    import subprocess
+    from pid.forward import ForwardError, socket_filename
+
+    piddir = str(tmp_path)
+    requests = []
+
+    def handler(payload):
+        requests.append(payload)
+        if payload == b"fail":
+            raise ValueError("cannot handle")
+        return b"handled " + payload
+
+    with pid.PidFile("forward", piddir=piddir, forward_handler=handler) as holder:
+        assert os.path.exists(socket_filename(holder.filename))
+
+        env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(pid.__file__))))
+        script = """
+import sys, pid
+pidfile = pid.PidFile("forward", piddir=sys.argv[1])
+try:
+    pidfile.create()
+except pid.PidFileAlreadyLockedError:
+    sys.stdout.write(pidfile.forward(sys.argv[2].encode()).decode())
+"""
+        assert subprocess.check_output([sys.executable, "-c", script, piddir, "--reload"], env=env) == b"handled --reload"
+
+        second = pid.PidFile("forward", piddir=piddir, register_atexit=False)
+        with pytest.raises(pid.PidFileAlreadyLockedError):
+            second.create()
+        start = time.time()
+        assert second.forward(b"ping") == b"handled ping"
+        print("forward round trip: %.2fms" % ((time.time() - start) * 1000))
+        with pytest.raises(ForwardError):
+            second.forward(b"fail")
+        assert requests == [b"--reload", b"ping", b"fail"]
+
+    assert not os.path.exists(socket_filename(holder.filename))
+    with pytest.raises(IOError):
+        second.forward(b"ping")
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="does not run on windows")
+def test_pid_forward_listener_failure(tmp_path):
+    # a socket path longer than AF_UNIX allows
+    piddir = str(tmp_path / ("d" * 120))
+    pidfile = pid.PidFile("forward", piddir=piddir, forward_handler=lambda payload: payload, register_atexit=False)
+    with pytest.raises((IOError, OSError)):
+        pidfile.create()
+    assert pidfile.fh is None or pidfile.fh.closed
+    assert not os.path.exists(pidfile.filename)
+
+    with pid.PidFile("forward", piddir=piddir):
+        pass